@@ -0,0 +1,117 @@
+from typing import Any
+
+import plotly.graph_objects as go
+import polars as pl
+from _plotly_utils.utils import to_typed_array_spec
+
+
+def column(values:pl.Series|pl.DataFrame) -> Any:
+    """
+    a column, or a frame's columns as a 2d array, the way plotly serializes data
+    arrays, numbers as base64 typed arrays and anything else as a list, so frames can
+    be built as plain dicts without plotly validating each one
+
+    args:
+        values: a Series, or a DataFrame of numeric columns
+
+    returns:
+        a typed array spec or a list
+    """
+    if isinstance(values, pl.DataFrame) or values.dtype.is_numeric():
+        return to_typed_array_spec(values.to_numpy())
+    return values.to_list()
+
+def _flatten(props:dict, prefix:tuple[str, ...]=()) -> dict[tuple[str, ...], Any]:
+    flat = {}
+    for key, value in props.items():
+        # typed arrays are values, not properties
+        if isinstance(value, dict) and 'bdata' not in value:
+            flat.update(_flatten(value, (*prefix, key)))
+        else:
+            flat[(*prefix, key)] = value
+    return flat
+
+def _unflatten(flat:dict[tuple[str, ...], Any]) -> dict:
+    props:dict = {}
+    for path, value in flat.items():
+        node = props
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = value
+    return props
+
+def _ordered_like(value:Any, template:Any) -> Any:
+    if isinstance(value, dict) and isinstance(template, dict):
+        return {
+            **{key:_ordered_like(value[key], template[key]) for key in template if key in value},
+            **{key:item for key, item in value.items() if key not in template},
+        }
+    if isinstance(value, list) and isinstance(template, list):
+        return [_ordered_like(item, template[i] if i < len(template) else None) for i, item in enumerate(value)]
+    return value
+
+def validate_frames(frames:list[dict]) -> list[dict]:
+    """
+    validates the first of a figure's frames against plotly's schema and puts every
+    frame's properties in the order plotly serializes them, so a figure written
+    with `validate=False` is identical to one built from `go.Frame`s
+
+    frames are assumed to share their structure, only their values differ
+
+    args:
+        frames: frame dicts, eg {'data':[...], 'traces':[0, 1], 'name':'2024'}
+
+    returns:
+        the frames, reordered
+    """
+    if not frames:
+        return frames
+    validated = go.Frame(frames[0]).to_plotly_json()
+    if validated != frames[0]:
+        raise ValueError(f'frame {frames[0].get("name")!r} does not match what plotly makes of it')
+    return [_ordered_like(frame, validated) for frame in frames]
+
+def delta_encode(fig:dict) -> dict:
+    """
+    rewrites a figure dict's animation frames so each frame trace only carries the
+    properties that differ between frames (eg `x`, `y`, `marker.size`), pointed at
+    its base trace with `traces`, while everything static stays on the base traces
+
+    frame traces are matched to base traces by `name`, or by position when unnamed,
+    a frame trace with no base trace raises a `ValueError` rather than being dropped
+
+    args:
+        fig: an animated figure as a dict, eg from `go.Figure.to_dict()` with its
+            frames stamped out with `column()`
+
+    returns:
+        the same dict, modified in place
+    """
+    names = [trace.get('name') for trace in fig['data']]
+    base = [_flatten(trace) for trace in fig['data']]
+    frames = []
+    for frame in fig.get('frames', []):
+        matched = {}
+        for i, trace in enumerate(frame['data']):
+            name = trace.get('name')
+            index = names.index(name) if name in names else i if name is None and i < len(base) else None
+            if index is None:
+                raise ValueError(f'frame {frame.get("name")!r} trace {name if name is not None else i!r} has no base trace')
+            matched[index] = _flatten(trace)
+        frames.append((frame, matched))
+
+    varying:dict[int, set[tuple[str, ...]]] = {i:set() for i in range(len(base))}
+    for _, matched in frames:
+        for index, props in matched.items():
+            varying[index].update(path for path, value in props.items() if value != base[index].get(path))
+
+    fig['frames'] = validate_frames([
+        {
+            'data':[_unflatten({path:props[path] for path in varying[index] | {('type',)} if path in props}) for index, props in matched.items()],
+            **({'layout':frame['layout']} if frame.get('layout') else {}),
+            'name':frame.get('name'),
+            'traces':list(matched),
+        }
+        for frame, matched in frames
+    ])
+    return fig
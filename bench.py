@@ -0,0 +1,526 @@
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import urllib.parse
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import numpy as np
+import polars as pl
+
+from datasets import DATASETS, DRUG_TYPES
+
+NS = 'http://tableau.com/api'
+SITE = 'bench'
+DATA_DIR = os.path.join('.cache', 'bench', 'data')
+BASELINE = os.path.join('.cache', 'bench', 'baseline.json')
+AZ_COUNTIES = {
+    '04001':'Apache', '04003':'Cochise', '04005':'Coconino', '04007':'Gila', '04009':'Graham',
+    '04011':'Greenlee', '04012':'La Paz', '04013':'Maricopa', '04015':'Mohave', '04017':'Navajo',
+    '04019':'Pima', '04021':'Pinal', '04023':'Santa Cruz', '04025':'Yavapai', '04027':'Yuma',
+}
+# the other us counties, so the geojson is the size of the real one
+OTHER_COUNTIES = 3200
+
+
+def _grid(**dims:list[Any]) -> pl.DataFrame:
+    # every combination of the dimensions, `_` keeps a view without any at one row
+    grid = pl.DataFrame({'_':[0]})
+    for name, values in dims.items():
+        grid = grid.join(pl.DataFrame({name:values}), how='cross')
+    return grid
+
+# each view's rows for one year at its natural grain, and its count columns with
+# the range their values are drawn from
+VIEWS:dict[str, tuple[pl.DataFrame, dict[str, tuple[int, int]]]] = {
+    'Total CS by Patient County':(
+        _grid(**{'Orig Patient County':[name.upper() for name in AZ_COUNTIES.values()], 'drug type':[*DRUG_TYPES, 'All']}),
+        {'Prescription Count':(100, 900_000)},
+    ),
+    'Total CS Dispensed':(_grid(), {'Prescription Count':(10_000_000, 20_000_000)}),
+    'Total CS Drug schedule':(_grid(**{'Drug Schedule':['2', '3', '4', '5']}), {'Prescription Count':(100_000, 10_000_000)}),
+    'OBS Dispensed':(_grid(obs=['opioid', 'benzodiazepine', 'stimulant', 'muscle relaxant']), {'Prescription Count':(100_000, 10_000_000)}),
+    'Total CS AZ?':(
+        _grid(**{'Prescriber AZ ?':['True', 'False'], 'drug type':DRUG_TYPES}),
+        {'Prescription Count':(1_000, 1_000_000)},
+    ),
+    'Bup Dispensed':(_grid(), {'Prescription Count':(100_000, 1_000_000)}),
+    'Opi Pills Dispensed':(_grid(), {'Prescription Count':(1_000_000, 5_000_000), 'Quantity':(10_000_000, 100_000_000)}),
+}
+
+
+def parse_rows(text:str) -> int|None:
+    """
+    args:
+        text: a row count like 1000, 100K, 1M or 50M, or 'grain' for each view's
+            natural size
+
+    returns:
+        the row count, None for 'grain'
+    """
+    if text == 'grain':
+        return None
+    match = re.fullmatch(r'(\d+)([KkMm]?)', text)
+    if match is None:
+        raise argparse.ArgumentTypeError(f'not a row count: {text!r}')
+    return int(match[1]) * {'':1, 'k':1_000, 'm':1_000_000}[match[2].lower()]
+
+def _label(rows:int|None) -> str:
+    return 'grain' if rows is None else str(rows)
+
+def _thousands(col:str) -> pl.Expr:
+    # tableau exports counts with thousands separators, keep the parser honest
+    x = pl.col(col)
+    pad = lambda e: e.cast(pl.String).str.zfill(3)
+    return (
+        pl.when(x >= 1_000_000).then(pl.format('{},{},{}', x // 1_000_000, pad(x // 1_000 % 1_000), pad(x % 1_000)))
+        .when(x >= 1_000).then(pl.format('{},{}', x // 1_000, pad(x % 1_000)))
+        .otherwise(x.cast(pl.String))
+        .alias(col)
+    )
+
+def synthetic_view(view:str, year:int, rows:int|None=None, filters:dict[str, set[str]]|None=None) -> pl.DataFrame:
+    """
+    builds one year of a view's export, deterministic for the same arguments
+
+    args:
+        view: a `VIEWS` name
+        year: the year of the rows
+        rows: rows for the year before filtering, the natural grain repeated with
+            new counts, None for the natural grain
+        filters: view filters, column name to the values to keep
+
+    returns:
+        a DataFrame of strings, laid out like the view's csv export
+    """
+    grid, counts = VIEWS[view]
+    n = grid.height if rows is None else max(rows, grid.height)
+    rng = np.random.default_rng([year, n, zlib.crc32(view.encode())])
+    frame = (
+        grid.select(pl.all().gather(pl.int_range(0, n) % grid.height))
+        .with_columns(
+            pl.lit(str(year)).alias('Year of Filled At'),
+            *[pl.Series(col, rng.integers(low, high, n)) for col, (low, high) in counts.items()],
+        )
+        .with_columns(_thousands(col) for col in counts)
+        .drop('_')
+    )
+    for col, values in (filters or {}).items():
+        if col in frame.columns:
+            frame = frame.filter(pl.col(col).is_in(list(values)))
+    return frame
+
+def _filter_values(value:str) -> set[str]:
+    # the inverse of tableau.view_filter_options, commas in values are escaped
+    return {part.replace('\\,', ',') for part in re.split(r'(?<!\\),', value)}
+
+def export_path(view:str, year:int, rows:int|None, filters:dict[str, set[str]]) -> str:
+    """
+    writes a view export to `DATA_DIR` if it isn't there already, so generating
+    data is never timed as part of a download
+
+    returns:
+        path of the csv
+    """
+    key = json.dumps([view, year, rows, {k:sorted(v) for k, v in sorted(filters.items())}])
+    path = os.path.join(DATA_DIR, f'{re.sub(r"[^a-z0-9]+", "_", view.lower())}-{year}-{_label(rows)}-{hashlib.sha256(key.encode()).hexdigest()[:12]}.csv')
+    if not os.path.exists(path):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        synthetic_view(view, year, rows, filters).write_csv(f'{path}.tmp')
+        os.replace(f'{path}.tmp', path)
+    return path
+
+def fips_txt() -> str:
+    lines = ['federal information processing standard codes', '', '     state-level      place', '     FIPS code        name', '    -----------   -------']
+    lines += ['         01        ALABAMA', '         04        ARIZONA', '         06        CALIFORNIA', '']
+    lines += ['', '     county-level      place', '     FIPS code         name', '    ------------    --------------']
+    lines += [f'        {fips}        {name} County' for fips, name in AZ_COUNTIES.items()]
+    lines += ['']
+    return '\n'.join(lines)
+
+def counties_geojson(vertices:int=50) -> dict:
+    """
+    returns:
+        a county FeatureCollection the size of the real one, the arizona counties
+        with their real fips codes, `vertices` points per ring
+    """
+    rng = random.Random(0)
+
+    def ring(cx:float, cy:float, r:float) -> list[list[float]]:
+        points = []
+        for i in range(vertices):
+            angle = 2 * math.pi * i / vertices
+            radius = r * (1 + 0.05 * rng.random())
+            points.append([round(cx + radius * math.cos(angle), 6), round(cy + radius * math.sin(angle), 6)])
+        return [*points, points[0]]
+
+    features = [
+        {'type':'Feature', 'id':fips, 'properties':{'NAME':name}, 'geometry':{'type':'Polygon', 'coordinates':[ring(-114 + i % 5 * 1.2, 32 + i // 5 * 1.4, 0.5)]}}
+        for i, (fips, name) in enumerate(AZ_COUNTIES.items())
+    ]
+    features += [
+        {'type':'Feature', 'id':f'{10 + i // 300:02d}{i % 300:03d}', 'properties':{'NAME':'other'}, 'geometry':{'type':'Polygon', 'coordinates':[ring(-100 + i % 60 * 0.5, 30 + i // 60 * 0.3, 0.2)]}}
+        for i in range(OTHER_COUNTIES)
+    ]
+    return {'type':'FeatureCollection', 'features':features}
+
+
+class StandIn:
+    """
+    a local http server answering the tableau rest calls the report makes (sign in,
+    workbook and view lookups, csv exports) for the `'annual report'` workbook, and
+    the county geojson, fips codes and acs populations
+
+    exports honour the start_year, end_year and column view filters and are served
+    from csvs written ahead of time by `prepare()`, sign ins are counted in
+    `sign_ins` and a request without the current token is answered with a 401
+    """
+    def __init__(self, rows:int|None=None, vertices:int=50):
+        """
+        args:
+            rows: rows per view and year, None for each view's natural grain
+            vertices: points per county ring in the geojson
+        """
+        self.rows = rows
+        self.views = {f'view-{i}':view for i, view in enumerate(VIEWS)}
+        self.geojson = json.dumps(counties_geojson(vertices)).encode()
+        self.requests = 0
+        self.sign_ins = 0
+        self.token:str|None = None
+        # exports still to answer with a 503
+        self.failing_exports = 0
+        # seconds each export is held before it is sent, and the most sent at once
+        self.export_delay = 0.0
+        self.peak_exports = 0
+        self._exports = 0
+        self._exports_lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def expire_token(self) -> None:
+        """
+        rejects the current auth token with a 401 until the client signs in again
+        """
+        self.token = None
+
+    def prepare(self, years:range) -> None:
+        """
+        writes every export the report will request for `years`
+        """
+        for dataset in DATASETS.values():
+            filters = {col:{str(v) for v in (value if isinstance(value, list) else [value])} for col, value in dataset.view_filters().items()}
+            for year in years:
+                export_path(dataset.view, year, self.rows, filters)
+
+    def _export(self, view:str, query:dict[str, list[str]]) -> str:
+        filters = {key[3:]:_filter_values(values[0]) for key, values in query.items() if key.startswith('vf_')}
+        start, end = int(min(filters.pop('start_year', {'2019'}))), int(max(filters.pop('end_year', {'2024'})))
+        if start != end:
+            # a whole window at once, only without an extract cache
+            paths = [export_path(view, year, self.rows, filters) for year in range(start, end + 1)]
+            path = os.path.join(DATA_DIR, f'window-{start}-{end}-{threading.get_ident()}.csv')
+            pl.concat([pl.read_csv(p, infer_schema=False) for p in paths]).write_csv(path)
+            return path
+        return export_path(view, start, self.rows, filters)
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format:str, *args:Any) -> None:
+                pass
+
+            def send(self, body:bytes|str, content_type:str='application/xml', status:int=200) -> None:
+                body = body.encode() if isinstance(body, str) else body
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_file(self, path:str) -> None:
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/csv')
+                self.send_header('Content-Length', str(os.path.getsize(path)))
+                self.end_headers()
+                with open(path, 'rb') as f:
+                    shutil.copyfileobj(f, self.wfile, 1 << 20)
+
+            def do_POST(self) -> None:
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.path.endswith('/auth/signin'):
+                    stand_in.sign_ins += 1
+                    stand_in.token = f'token-{stand_in.sign_ins}'
+                    self.send(f'<tsResponse xmlns="{NS}"><credentials token="{stand_in.token}"><site id="{SITE}" contentUrl="{SITE}"/><user id="user"/></credentials></tsResponse>')
+                else:
+                    self.send(b'', status=204)
+
+            def do_GET(self) -> None:
+                stand_in.requests += 1
+                url = urllib.parse.urlparse(self.path)
+                query = urllib.parse.parse_qs(url.query)
+                path = url.path
+                if path.endswith('/serverInfo'):
+                    return self.send(f'<tsResponse xmlns="{NS}"><serverInfo><productVersion build="1">2024.2</productVersion><restApiVersion>3.23</restApiVersion></serverInfo></tsResponse>')
+                if path.startswith('/api/') and self.headers.get('x-tableau-auth') != stand_in.token:
+                    return self.send(f'<tsResponse xmlns="{NS}"><error code="401002"><summary>Unauthorized Access</summary><detail>Invalid authentication credentials were provided.</detail></error></tsResponse>', status=401)
+                if path.endswith('/workbooks'):
+                    return self.send(f'<tsResponse xmlns="{NS}"><pagination pageNumber="1" pageSize="100" totalAvailable="1"/><workbooks><workbook id="workbook" name="annual report"><project id="project"/><owner id="user"/></workbook></workbooks></tsResponse>')
+                if path.endswith('/workbooks/workbook/views'):
+                    views = ''.join(f'<view id="{luid}" name="{name}" contentUrl="annual/{luid}"/>' for luid, name in stand_in.views.items())
+                    return self.send(f'<tsResponse xmlns="{NS}"><pagination pageNumber="1" pageSize="100" totalAvailable="{len(stand_in.views)}"/><views>{views}</views></tsResponse>')
+                if '/views/' in path and path.endswith('/data') and stand_in.failing_exports:
+                    stand_in.failing_exports -= 1
+                    return self.send(b'busy', 'text/plain', status=503)
+                if '/views/' in path and path.endswith('/data'):
+                    with stand_in._exports_lock:
+                        stand_in._exports += 1
+                        stand_in.peak_exports = max(stand_in.peak_exports, stand_in._exports)
+                    try:
+                        time.sleep(stand_in.export_delay)
+                        return self.send_file(stand_in._export(stand_in.views[path.split('/')[-2]], query))
+                    finally:
+                        with stand_in._exports_lock:
+                            stand_in._exports -= 1
+                if '/views/' in path:
+                    luid = path.split('/')[-1]
+                    return self.send(f'<tsResponse xmlns="{NS}"><view id="{luid}" name="{stand_in.views[luid]}" contentUrl="annual/{luid}"><workbook id="workbook"/><owner id="user"/><project id="project"/></view></tsResponse>')
+                if path == '/counties.geojson':
+                    return self.send(stand_in.geojson, 'application/json')
+                if path == '/fips.txt':
+                    return self.send(fips_txt(), 'text/plain')
+                if path.endswith('/acs/acs5'):
+                    rng = random.Random(path)
+                    rows = [['B01003_001E', 'state', 'county'], *[[str(rng.randint(9_000, 4_500_000)), fips[:2], fips[2:]] for fips in AZ_COUNTIES]]
+                    return self.send(json.dumps(rows), 'application/json')
+                self.send(b'', status=404)
+
+        return Handler
+
+
+def run(url:str, rows:int|None, render:bool, work_dir:str) -> dict[str, Any]:
+    """
+    runs the pipeline once against the stand in, in a fresh process
+
+    args:
+        url: the `StandIn` url
+        rows: the size being run, recorded with the results
+        render: if True, render every section too
+        work_dir: directory for the caches and charts of this run
+
+    returns:
+        a dict of `rows`, the spans recorded and the process's `peak_rss`
+    """
+    os.environ.update(TABLEAU_SERVER=url, TABLEAU_SITE=SITE, TABLEAU_TOKEN_NAME='bench', TABLEAU_TOKEN_VALUE='bench', CENSUS_API_KEY='bench')
+    # imported here, after the environment is set up, and timed as part of the run
+    import resource
+
+    import sections
+    import tableau
+    import yearly_figures
+    from extract_cache import ExtractCache
+    from reference import ReferenceData
+    from telemetry import span, tracer
+
+    reference = ReferenceData(cache_dir=os.path.join(work_dir, 'reference'))
+    reference.counties_url = f'{url}/counties.geojson'
+    reference.fips_url = f'{url}/fips.txt'
+    reference.acs_url = f'{url}/data/{{vintage}}/acs/acs5'
+    extract_cache = ExtractCache(cache_dir=os.path.join(work_dir, 'extracts'), max_bytes=2**62)
+    with tableau.TableauClient(cache_dir=os.path.join(work_dir, 'tableau'), extract_cache=extract_cache) as client, span('bench.ingest'):
+        data = yearly_figures.fetch_all(client, reference, yearly_figures.report_window(yearly_figures.YEAR))
+    with span('bench.transform'):
+        frames = yearly_figures.collect_frames(yearly_figures.derive(data))
+    if render:
+        out_dir = os.path.join(work_dir, 'charts')
+        os.makedirs(out_dir, exist_ok=True)
+        with span('bench.render'):
+            for name in sections.SECTIONS:
+                sections.render_section(name, {**frames, 'counties':data['counties']}, out_dir)
+    return {
+        'rows':rows,
+        'spans':[asdict(s) for s in tracer.spans],
+        'peak_rss':resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if platform.system() == 'Darwin' else 1024),
+    }
+
+def summarize(spans:list[dict[str, Any]]) -> dict[str, dict[str, float]]:
+    """
+    returns:
+        per stage name, the total seconds, largest peak rss growth, and total rows
+        and bytes, plus rows per second
+    """
+    stages:dict[str, dict[str, float]] = {}
+    for s in spans:
+        stage = stages.setdefault(s['name'], {'count':0, 'seconds':0.0, 'peak_rss_delta':0, 'rows':0, 'bytes_downloaded':0, 'bytes_written':0})
+        stage['count'] += 1
+        stage['seconds'] += s['seconds']
+        stage['peak_rss_delta'] = max(stage['peak_rss_delta'], s['peak_rss_delta'])
+        for key in ('rows', 'bytes_downloaded', 'bytes_written'):
+            stage[key] += s[key]
+    for stage in stages.values():
+        stage['rows_per_s'] = stage['rows'] / stage['seconds'] if stage['seconds'] else 0.0
+    return stages
+
+# stages timed end to end, compared with the baseline, the per download and per
+# extract spans overlap on the thread pool so they're only kept in the results
+COMPARED = ('bench.ingest', 'bench.transform', 'bench.render', *(f'render.{name}' for name in ('county_data', 'cs_dispensed', 'obs', 'oos_rx', 'bup', 'opi_pills')))
+
+def compare(results:dict[str, Any], baseline:dict[str, Any], tolerance:float, floor:float=0.25) -> list[str]:
+    """
+    prints each compared stage and each size's peak memory against the baseline
+
+    args:
+        results: this run, as written by `main()`
+        baseline: an earlier run
+        tolerance: fractional slowdown (or memory growth) reported as a regression
+        floor: seconds under which a stage is too noisy to call a regression
+
+    returns:
+        the regressions found, one line each
+    """
+    regressions = []
+    print(f'{"rows":>10}  {"stage":<22} {"base":>8} {"now":>8} {"ratio":>6}')
+    for label, stages in results['sizes'].items():
+        base_stages = baseline['sizes'].get(label, {})
+        for name in COMPARED:
+            if name not in stages or name not in base_stages:
+                continue
+            now, base = stages[name]['seconds'], base_stages[name]['seconds']
+            ratio = now / base if base else float('inf')
+            flag = ' slower' if now > floor and ratio > 1 + tolerance else ''
+            if flag:
+                regressions.append(f'{label} {name}: {base:.2f}s -> {now:.2f}s')
+            print(f'{label:>10}  {name:<22} {base:7.2f}s {now:7.2f}s {ratio:6.2f}{flag}')
+        if label in baseline['peak_rss']:
+            now, base = results['peak_rss'][label] / 1e6, baseline['peak_rss'][label] / 1e6
+            flag = ' more memory' if now > base * (1 + tolerance) else ''
+            if flag:
+                regressions.append(f'{label} peak rss: {base:.0f}MB -> {now:.0f}MB')
+            print(f'{label:>10}  {"peak rss":<22} {base:6.0f}MB {now:6.0f}MB {now / base:6.2f}{flag}')
+    return regressions
+
+def download_memory(results:dict[str, Any], floor:float=64e6, fraction:float=0.5) -> list[str]:
+    """
+    checks that csv downloads stream, a download whose peak rss growth is a good
+    part of the export it wrote is holding the export in memory
+
+    args:
+        results: this run, as written by `main()`
+        floor: bytes of growth under which a download is too noisy to call
+        fraction: growth, as a fraction of the mean export size, reported
+
+    returns:
+        the sizes whose downloads grew with the export, one line each
+    """
+    flagged = []
+    for label, stages in results['sizes'].items():
+        download = stages.get('tableau.download')
+        if not download or not download['count']:
+            continue
+        export = download['bytes_downloaded'] / download['count']
+        growth = download['peak_rss_delta']
+        if growth > floor and growth > export * fraction:
+            flagged.append(f'{label} tableau.download: peak rss grew {growth / 1e6:.0f}MB for {export / 1e6:.0f}MB exports, downloads are not streaming')
+    return flagged
+
+def report(results:dict[str, Any]) -> None:
+    print(f'{"rows":>10}  {"ingest s":>9} {"rows/s":>12} {"MB/s down":>10} {"transform s":>12} {"render s":>9} {"peak MB":>8}')
+    for label, stages in results['sizes'].items():
+        ingest = stages['bench.ingest']['seconds']
+        rows = stages.get('tableau.write_extract', {}).get('rows', 0)
+        downloaded = stages.get('tableau.download', {}).get('bytes_downloaded', 0)
+        render = f'{stages["bench.render"]["seconds"]:9.2f}' if 'bench.render' in stages else f'{"-":>9}'
+        print(f'{label:>10}  {ingest:9.2f} {rows / ingest:12,.0f} {downloaded / 1e6 / ingest:10.1f} {stages["bench.transform"]["seconds"]:12.2f} {render} {results["peak_rss"][label] / 1e6:8.0f}')
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the report pipeline against a local tableau and census stand in')
+    parser.add_argument('--rows', nargs='+', type=parse_rows, default=[None, 1_000, 100_000, 1_000_000], metavar='ROWS', help='rows in each yearly view export, eg grain 1K 100K 1M 50M, defaults to grain 1K 100K 1M')
+    parser.add_argument('--render', nargs='*', type=parse_rows, default=[None], metavar='ROWS', help='sizes to render the sections at too, defaults to grain only, the builders expect one row per category and year')
+    parser.add_argument('--repeat', type=int, default=1, help='runs of each size, the fastest time of each stage is kept')
+    parser.add_argument('--vertices', type=int, default=50, help='points per county ring in the synthetic geojson')
+    parser.add_argument('--out', default=os.path.join('.cache', 'bench', f'{time.strftime("%Y%m%d-%H%M%S")}.json'), help='where to write the results')
+    parser.add_argument('--baseline', default=BASELINE, help='results to compare with')
+    parser.add_argument('--save', action='store_true', help='save these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='fractional slowdown or memory growth reported as a regression')
+    parser.add_argument('--keep', action='store_true', help='keep each run\'s caches and charts')
+    args = parser.parse_args()
+
+    import yearly_figures
+    years = yearly_figures.report_window(yearly_figures.YEAR)
+    results:dict[str, Any] = {
+        'created_at':time.time(),
+        'python':platform.python_version(),
+        'polars':pl.__version__,
+        'cpus':os.cpu_count(),
+        'sizes':{},
+        'peak_rss':{},
+    }
+    for rows in args.rows:
+        label = _label(rows)
+        stand_in = StandIn(rows, args.vertices)
+        print(f'preparing {label} rows per view and year...')
+        stand_in.prepare(years)
+        runs = []
+        try:
+            for _ in range(args.repeat):
+                work_dir = tempfile.mkdtemp(prefix=f'bench-{label}-')
+                try:
+                    start = time.perf_counter()
+                    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                        runs.append(pool.submit(run, stand_in.url, rows, rows in args.render, work_dir).result())
+                    print(f'ran {label} in {time.perf_counter() - start:.2f}s ({stand_in.requests} requests)')
+                finally:
+                    if not args.keep:
+                        shutil.rmtree(work_dir, ignore_errors=True)
+        finally:
+            stand_in.close()
+        # the fastest of the repeats, noise only ever adds time
+        summaries = [summarize(result['spans']) for result in runs]
+        results['sizes'][label] = {
+            name:min((summary[name] for summary in summaries), key=lambda stage: stage['seconds'])
+            for name in summaries[0]
+        }
+        results['peak_rss'][label] = min(result['peak_rss'] for result in runs)
+
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    report(results)
+    print(f'results written to {args.out}')
+    print('\n'.join(download_memory(results)) or 'downloads stream')
+
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        print('\n'.join(regressions) if regressions else 'no regressions')
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        shutil.copyfile(args.out, args.baseline)
+        print(f'saved as the baseline, {args.baseline}')
+
+if __name__ == '__main__':
+    main()
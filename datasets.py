@@ -0,0 +1,104 @@
+from dataclasses import dataclass, field
+from typing import Any
+
+import polars as pl
+
+
+@dataclass(frozen=True)
+class Dataset:
+    """
+    a tableau view the report reads, declared once with its typed schema
+
+    attributes:
+        view: name of the view in the report workbook
+        schema: dict of source column name to (new name, dtype) for the columns
+            the report uses, applied when the extract csv is read, so cached
+            extracts hold only these columns already typed
+        transforms: optional expressions applied lazily after the schema, for
+            cleaning that isn't a rename or a cast
+        filterable: columns, by their new name, the view can filter on server side
+        where: rows the report keeps, a dict of column name to a value or a list
+            of values to keep any of, predicates on `filterable` columns are sent
+            to tableau as view filters so only those rows are exported
+    """
+    view:str
+    schema:dict[str, tuple[str, pl.DataType]]
+    transforms:tuple[pl.Expr, ...] = ()
+    filterable:tuple[str, ...] = ()
+    where:dict[str, Any] = field(default_factory=dict)
+
+    def view_filters(self) -> dict[str, Any]:
+        """
+        returns:
+            the `where` predicates on `filterable` columns, keyed by the source
+            column name tableau knows them by
+        """
+        sources = {name:source for source, (name, _) in self.schema.items()}
+        return {sources[name]:value for name, value in self.where.items() if name in self.filterable}
+
+    def project(self, typed:pl.LazyFrame) -> pl.LazyFrame:
+        """
+        applies the declared transforms and `where` predicates to a typed view extract
+
+        the predicates are applied locally too, pushed down or not, since tableau
+        silently ignores a view filter on a field the view doesn't have
+
+        args:
+            typed: LazyFrame over the extract read with `schema`, pulled with
+                `view_filters()`
+
+        returns:
+            a LazyFrame with the declared, typed and cleaned columns
+        """
+        lf = typed.with_columns(self.transforms) if self.transforms else typed
+        for name, value in self.where.items():
+            lf = lf.filter(pl.col(name).is_in(value if isinstance(value, (list, tuple)) else [value]))
+        return lf
+
+
+# the drug type values the views split prescriptions by, besides 'All'
+DRUG_TYPES = ['opioid', 'benzodiazepine', 'stimulant', 'androgen', 'buprenorphine']
+YEAR_FILLED = {'Year of Filled At':('year_filled', pl.Int64())}
+RX_COUNT = {'Prescription Count':('rx_count', pl.Int32())}
+
+DATASETS = {
+    'rx_pat_county':Dataset(
+        view='Total CS by Patient County',
+        schema={
+            'Orig Patient County':('county', pl.String()),
+            **YEAR_FILLED,
+            'drug type':('drug type', pl.String()),
+            **RX_COUNT,
+        },
+        transforms=(pl.col('county').str.to_uppercase(),)
+    ),
+    'cs_disp':Dataset(
+        view='Total CS Dispensed',
+        schema={**YEAR_FILLED, **RX_COUNT}
+    ),
+    # 'cs_disp_sched':Dataset( # not interesting this year
+    #     view='Total CS Drug schedule',
+    #     schema={**YEAR_FILLED, **RX_COUNT, 'Drug Schedule':('drug_schedule', pl.String())}
+    # ),
+    'obs':Dataset(
+        view='OBS Dispensed',
+        schema={**YEAR_FILLED, **RX_COUNT, 'obs':('drug', pl.String())},
+        filterable=('drug',),
+        where={'drug':['opioid', 'benzodiazepine', 'stimulant']}
+    ),
+    'oos':Dataset(
+        view='Total CS AZ?',
+        schema={**YEAR_FILLED, **RX_COUNT, 'Prescriber AZ ?':('presc_az', pl.Boolean()), 'drug type':('drug type', pl.String())},
+        filterable=('drug type',),
+        where={'drug type':['benzodiazepine', 'androgen']}
+    ),
+    'bup_rx':Dataset(
+        view='Bup Dispensed',
+        schema={**YEAR_FILLED, **RX_COUNT}
+    ),
+    'pills':Dataset(
+        view='Opi Pills Dispensed',
+        schema={**YEAR_FILLED, **RX_COUNT, 'Quantity':('pills_count', pl.Float32())},
+        transforms=(pl.col('pills_count').round(0),)
+    ),
+}
@@ -0,0 +1,119 @@
+import polars as pl
+
+# the columns each dataset's counts are broken down by, `drug type` is called
+# `drug` in the summary
+DIMENSIONS:dict[str, tuple[str, ...]] = {
+    'rx_pat_county':('county', 'drug type'),
+    'cs_disp':(),
+    'obs':('drug',),
+    'oos':('drug type', 'presc_az'),
+    'bup_rx':(),
+    'pills':(),
+}
+SUFFIXES = ['', 'K', 'M', 'B', 'T']
+
+
+def human_format(expr:pl.Expr) -> pl.Expr:
+    """
+    formats whole numbers to 3 significant figures with a K, M, B or T suffix, eg
+    1234 -> '1.23K', -25000000 -> '-25M'
+
+    rounds half to even in integer arithmetic, so it matches python's
+    `'{:.3g}'.format()` exactly
+
+    args:
+        expr: an integer expression
+
+    returns:
+        a string expression
+    """
+    value = expr.cast(pl.Int64)
+    magnitude = value.abs()
+    digits = magnitude.cast(pl.String).str.len_chars().cast(pl.Int64)
+    scale = pl.lit(10, pl.Int64).pow((digits - 3).clip(lower_bound=0))
+    kept, dropped = magnitude // scale, magnitude % scale
+    kept = kept + ((dropped * 2 > scale) | ((dropped * 2 == scale) & (kept % 2 == 1))).cast(pl.Int64)
+    rounded = kept * scale
+    thousands = ((rounded.cast(pl.String).str.len_chars() - 1) // 3).clip(upper_bound=len(SUFFIXES) - 1)
+    unit = pl.lit(1000, pl.Int64).pow(thousands)
+    fraction = (rounded % unit).cast(pl.String).str.zfill(thousands * 3).str.strip_chars_end('0')
+    return pl.concat_str(
+        pl.when(value < 0).then(pl.lit('-')).otherwise(pl.lit('')),
+        (rounded // unit).cast(pl.String),
+        pl.when(fraction == '').then(pl.lit('')).otherwise(pl.lit('.') + fraction),
+        pl.lit(pl.Series(SUFFIXES)).get(thousands),
+    )
+
+def yoy(frame:pl.LazyFrame, keys:tuple[str, ...]|list[str], value:str='rx_count', year:str='year_filled') -> pl.LazyFrame:
+    """
+    year over year changes of `value` for every combination of `keys`, in one
+    group by
+
+    args:
+        frame: a LazyFrame with `keys`, `year` and `value` columns
+        keys: the columns the changes are broken down by
+        value: the column summed and compared
+        year: the year column
+
+    returns:
+        a LazyFrame of `keys`, `year`, `value`, `prev` (the value the year before,
+        null for the first year or after a gap), `delta`, `pct_change` (null when
+        `prev` is 0), and the formatted `delta_label` and `pct_label`
+    """
+    keys = list(keys)
+    totals = frame.group_by(*keys, year).agg(pl.col(value).sum()).sort(*keys, year)
+    before = lambda col: pl.col(col).shift(1).over(partition_by=keys or None, order_by=year)
+    prev = pl.when(before(year) == pl.col(year) - 1).then(before(value))
+    # no percentage change from zero
+    pct = pl.when(pl.col('prev') != 0).then(pl.col('delta') / pl.col('prev'))
+    return (
+        totals
+        .with_columns(prev.alias('prev'))
+        .with_columns((pl.col(value).cast(pl.Int64) - pl.col('prev')).alias('delta'))
+        .with_columns(
+            pct.alias('pct_change'),
+            human_format(pl.col('delta')).alias('delta_label'),
+            pl.format('{}%', (pct * 100).round(1)).alias('pct_label'),
+        )
+        .with_columns(pl.when(pl.col('pct_change') > 0).then('+' + pl.col('pct_label')).otherwise('pct_label').alias('pct_label'))
+    )
+
+def summary(data:dict[str, pl.LazyFrame]) -> pl.LazyFrame:
+    """
+    the tidy year over year table for every dataset in `data` that has
+    `DIMENSIONS`, so any chart can annotate from the same numbers
+
+    args:
+        data: dict of `DATASETS` key to its projected LazyFrame
+
+    returns:
+        a LazyFrame of `dataset`, `county`, `drug` and `presc_az` (null where the
+        dataset isn't broken down by them), then the columns of `yoy()`
+    """
+    tables = [
+        yoy(data[key], keys)
+        .rename({'drug type':'drug'}, strict=False)
+        .with_columns(pl.lit(key).alias('dataset'))
+        for key, keys in DIMENSIONS.items() if key in data
+    ]
+    # an empty frame so every dimension is in the output whichever datasets are given
+    empty = pl.LazyFrame(schema={'dataset':pl.String, 'county':pl.String, 'drug':pl.String, 'presc_az':pl.Boolean})
+    return pl.concat([empty, *tables], how='diagonal_relaxed')
+
+def largest_movers(table:pl.LazyFrame, n:int=10, min_prev:int=1000) -> pl.LazyFrame:
+    """
+    args:
+        table: the output of `summary()`
+        n: rows to keep
+        min_prev: the least a series must have had the year before, so small
+            counts doubling don't crowd out real changes
+
+    returns:
+        the `n` series with the largest relative change into the latest year
+    """
+    return (
+        table
+        .filter((pl.col('year_filled') == pl.col('year_filled').max()) & (pl.col('prev') >= min_prev))
+        .sort(pl.col('pct_change').abs(), descending=True)
+        .head(n)
+    )
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import urllib.parse
+from typing import Any
+
+import polars as pl
+
+
+class ExtractCache:
+    """
+    an on disk cache of tableau view extracts stored as parquet
+
+    entries are keyed by view luid, view filters and read kwargs, expire `ttl`
+    seconds after they were written, and the least recently used entries are
+    evicted once the cache grows past `max_bytes`
+
+    each entry is a `{key}.parquet` file plus a `{key}.json` sidecar describing
+    what was fetched, the parquet mtime is bumped on every hit so it doubles as
+    the last used time
+
+    entries handed out by this instance are never evicted by it, since the lazy
+    scans returned for them may not have been collected yet
+
+    partitioned extracts (one chunk per year, county, drug type...) live in a hive
+    style parquet dataset per view, filters and read kwargs under `partitions/`,
+    and are only replaced when asked to, their chunks count towards `max_bytes`
+    and are evicted with the other entries, the chunk's mtime is when it was
+    written and its atime, set on every hit, the last used time
+
+    a dataset whose view is read with a new schema or filters leaves the old one
+    behind, `prune_partitions()` removes those
+    """
+    def __init__(self, cache_dir:str='.cache/extracts', ttl:float=86400.0, max_bytes:int=2*1024**3):
+        """
+        args:
+            cache_dir: directory the parquet files are kept in
+            ttl: seconds after writing before an entry is considered stale
+            max_bytes: total parquet size allowed before lru eviction kicks in
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._pinned:set[str] = set()
+        self._datasets:set[str] = set()
+        # eviction removes emptied partition directories, writers create them
+        self._dirs_lock = threading.Lock()
+
+    @staticmethod
+    def key(view_id:str, filters:dict|None, read_kwargs:dict[str, Any]) -> str:
+        """
+        builds the cache key for a view extract
+
+        args:
+            view_id: luid of the view
+            filters: the view filters the extract was pulled with
+            read_kwargs: kwargs passed to polars when reading the csv
+
+        returns:
+            a hex digest identifying the extract
+        """
+        payload = json.dumps({'view_id':view_id, 'filters':filters or {}, 'read_kwargs':read_kwargs}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key:str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.parquet')
+
+    def _meta_path(self, key:str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def get(self, key:str, ignore_ttl:bool=False) -> str|None:
+        """
+        looks up a cached extract and marks it as recently used
+
+        args:
+            key: cache key from `key()`
+            ignore_ttl: if True, return the entry even if it is stale
+
+        returns:
+            the parquet path of the entry, or None on a miss
+        """
+        try:
+            with open(self._meta_path(key)) as f:
+                written_at = json.load(f)['written_at']
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        if not ignore_ttl and time.time() - written_at > self.ttl:
+            return None
+        os.utime(path)
+        self._pinned.add(key)
+        return path
+
+    def put(self, key:str, frame:pl.DataFrame|pl.LazyFrame, **meta:Any) -> str:
+        """
+        writes an extract to the cache then evicts old entries if over `max_bytes`
+
+        args:
+            key: cache key from `key()`
+            frame: the extract, a LazyFrame is streamed to disk with `sink_parquet`
+            meta: extra json serializable details to store in the sidecar
+
+        returns:
+            the parquet path of the new entry
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        if isinstance(frame, pl.LazyFrame):
+            frame.sink_parquet(f'{path}.tmp')
+        else:
+            frame.write_parquet(f'{path}.tmp')
+        os.replace(f'{path}.tmp', path)
+        rows = pl.scan_parquet(path).select(pl.len()).collect().item()
+        with open(self._meta_path(key), 'w') as f:
+            json.dump({'written_at':time.time(), 'rows':rows, **meta}, f, indent=2, default=str)
+        self._pinned.add(key)
+        self.evict()
+        return path
+
+    def evict(self) -> list[str]:
+        """
+        deletes least recently used entries until the cache fits in `max_bytes`,
+        skipping entries this instance has handed out
+
+        returns:
+            the keys and partition paths that were evicted
+        """
+        with self._dirs_lock:
+            return self._evict()
+
+    def _evict(self) -> list[str]:
+        # (last used, size, key or partition path, files)
+        entries:list[tuple[float, int, str, tuple[str, ...]]] = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.parquet'):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                key = name.removesuffix('.parquet')
+                entries.append((stat.st_mtime, stat.st_size, key, (self._path(key), self._meta_path(key))))
+        for root, _, files in os.walk(self._partitions_dir):
+            if 'data.parquet' in files:
+                path = os.path.join(root, 'data.parquet')
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_atime, stat.st_size, path, (path,)))
+        total = sum(size for _, size, _, _ in entries)
+        evicted = []
+        for _, size, key, paths in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key in self._pinned:
+                continue
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            if key.startswith(self._partitions_dir):
+                self._remove_empty_dirs(os.path.dirname(key))
+            total -= size
+            evicted.append(key)
+        return evicted
+
+    @property
+    def _partitions_dir(self) -> str:
+        return os.path.join(self.cache_dir, 'partitions')
+
+    def _remove_empty_dirs(self, path:str) -> None:
+        # up to, not including, the dataset directory, `prune_partitions()` removes those
+        while os.path.dirname(path) != self._partitions_dir and path.startswith(self._partitions_dir):
+            try:
+                os.rmdir(path)
+            except OSError:
+                return
+            path = os.path.dirname(path)
+
+    def prune_partitions(self) -> list[str]:
+        """
+        deletes the partitioned datasets of views this instance has read that were
+        pulled with a schema, filters or read kwargs it did not ask for, call it
+        after every dataset the report reads has been requested
+
+        returns:
+            the dataset directory names that were removed
+        """
+        views = {dataset.rsplit('-', 1)[0] for dataset in self._datasets}
+        try:
+            names = os.listdir(self._partitions_dir)
+        except FileNotFoundError:
+            return []
+        pruned = []
+        for name in names:
+            if name.rsplit('-', 1)[0] in views and name not in self._datasets:
+                shutil.rmtree(os.path.join(self._partitions_dir, name), ignore_errors=True)
+                pruned.append(name)
+        return pruned
+
+    def _partition_path(self, view_id:str, filters:dict|None, read_kwargs:dict[str, Any], partition:dict[str, Any]) -> str:
+        dataset = f'{view_id}-{self.key(view_id, filters, read_kwargs)[:12]}'
+        self._datasets.add(dataset)
+        parts = [f'{urllib.parse.quote(str(k), safe="")}={urllib.parse.quote(str(v), safe="")}' for k, v in partition.items()]
+        return os.path.join(self._partitions_dir, dataset, *parts, 'data.parquet')
+
+    def get_partition(self, view_id:str, filters:dict|None, read_kwargs:dict[str, Any], partition:dict[str, Any], max_age:float|None=None) -> str|None:
+        """
+        looks up one chunk of a partitioned extract
+
+        args:
+            view_id: luid of the view
+            filters: view filters, besides the partition's, the extract was pulled with
+            read_kwargs: kwargs passed to polars when reading the csv
+            partition: the chunk's partition values, eg {'year_filled':2024}
+            max_age: optional seconds after writing before the chunk is considered stale
+
+        returns:
+            the parquet path of the chunk, or None if it has not been pulled or is stale
+        """
+        path = self._partition_path(view_id, filters, read_kwargs, partition)
+        try:
+            written_at = os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+        if max_age is not None and time.time() - written_at > max_age:
+            return None
+        # the atime marks the use, the mtime stays the time it was written
+        os.utime(path, (time.time(), written_at))
+        self._pinned.add(path)
+        return path
+
+    def put_partition(self, view_id:str, filters:dict|None, read_kwargs:dict[str, Any], partition:dict[str, Any], frame:pl.LazyFrame) -> str:
+        """
+        writes one chunk of a partitioned extract, replacing any earlier pull
+
+        args:
+            view_id: luid of the view
+            filters: view filters, besides the partition's, the extract was pulled with
+            read_kwargs: kwargs passed to polars when reading the csv
+            partition: the chunk's partition values, eg {'year_filled':2024}
+            frame: the extract for that chunk
+
+        returns:
+            the parquet path of the chunk
+        """
+        path = self._partition_path(view_id, filters, read_kwargs, partition)
+        with self._dirs_lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        frame.sink_parquet(f'{path}.tmp')
+        os.replace(f'{path}.tmp', path)
+        self._pinned.add(path)
+        self.evict()
+        return path
@@ -0,0 +1,406 @@
+import itertools
+import os
+from typing import Any
+
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+import polars as pl
+from plotly.subplots import make_subplots
+
+import animation
+import geometry
+
+
+def latest_change(yoy:pl.DataFrame, **keys:Any) -> dict[str, Any]:
+    """
+    args:
+        yoy: year over year changes from `deltas.summary()`
+        keys: the series, eg drug='benzodiazepine', presc_az=False
+
+    returns:
+        the series' row for its latest year, with its `prev`, `rx_count` and
+        `delta_label`
+    """
+    series = yoy.filter(**keys)
+    return series.filter(pl.col('year_filled') == pl.col('year_filled').max()).row(0, named=True)
+
+def county_data(pat_county_rates:pl.DataFrame, counties:dict, out_dir:str|None) -> dict[str, dict]:
+    # ---
+    # county data
+    # ---
+    print('generating county data...')
+
+    fig = make_subplots(
+        rows=2, cols=3,
+        subplot_titles=(
+            'all_cs', 'opioids', 'benzodiazepines', 'stimulants', 'buprenorphine', 'androgens'
+        ),
+        vertical_spacing=0.04,
+        horizontal_spacing=.005,
+        specs=[
+            [{'type': 'geo'}, {'type': 'geo'}, {'type': 'geo'}],
+            [{'type': 'geo'}, {'type': 'geo'}, {'type': 'geo'}]
+        ]
+    )
+
+    metrics = [('rx_per1000','all_cs'), ('opi_rx_per1000','opioid'), ('benzo_rx_per1000','benzodiazepine'), ('stim_rx_per1000','stimulant'), ('bup_rx_per1000','buprenorphine'), ('andro_rx_per1000','androgen')]
+    positions = [(1, 1), (1, 2), (1, 3), (2, 1), (2, 2), (2,3)]
+
+    # every year is aligned to one fixed county order, so locations and hovertext
+    # live on the base traces and frames only carry z and the counts
+    locations = pat_county_rates.filter(pl.col('fips').is_not_null()).select('fips', 'patient_county').unique('fips').sort('fips')
+    years = {
+        year:locations.select('fips').join(year_rates, on='fips', how='left', maintain_order='left')
+        for (year,), year_rates in sorted(pat_county_rates.partition_by('year_filled', as_dict=True).items())
+    }
+    first_year = next(iter(years.values()))
+
+    for (row, col), metric in zip(positions, metrics):
+        fig.add_trace(go.Choropleth(
+            geojson=geometry.SHARED_GEOJSON,
+            locations=locations['fips'],
+            z=first_year[metric[0]],
+            marker_opacity=1,
+            marker_line_width=0,
+            showscale=(row == 1 and col == 1),
+            colorbar_showticklabels=False,
+            hovertext=locations['patient_county'],
+            hoverinfo="text+z",
+            customdata=first_year[[metric[1], 'population']],
+            hovertemplate=(
+                '<b>%{hovertext}</b><br>'
+                f'{metric[0]}: %{{z:.2f}}<br>'
+                f'{metric[1]}: %{{customdata[0]:.3s}}<br>'
+                'population: %{customdata[1]:.3s}<br>'
+                '<extra></extra>'
+            )
+        ), row=row, col=col)
+
+    # frames are built as plain dicts of typed arrays, plotly only validates the first
+    frames = animation.validate_frames([
+        {
+            'data':[{'customdata':animation.column(year_rates[[metric[1], 'population']]), 'z':animation.column(year_rates[metric[0]]), 'type':'choropleth'} for metric in metrics],
+            'name':str(year),
+            'traces':list(range(len(metrics))),
+        }
+        for year, year_rates in years.items()
+    ])
+
+    fig.update_layout(
+        margin=dict(l=10, r=10, t=20, b=10),
+        updatemenus=[{
+            'type': 'buttons',
+            'showactive': True,
+            'x': 0.1,
+            'xanchor': 'left',
+            'y': -0.05,
+            'yanchor': 'top',
+            'direction': 'left',
+            'buttons': [
+                {
+                    'label': '▶',
+                    'method': 'animate',
+                    'args': [None, {'frame': {'duration': 1000, 'redraw': True}, 'fromcurrent': True}]
+                },
+                {
+                    'label': '⏸',
+                    'method': 'animate',
+                    'args': [[None], {'frame': {'duration': 0, 'redraw': True}, 'mode': 'immediate'}]
+                }
+            ]
+        }],
+        sliders=[{
+            'active': 0,
+            'x': 0.2,
+            'len': 0.8,
+            'steps': [
+                {
+                    'args': [[frame['name']], {'frame': {'duration': 0, 'redraw': True}, 'mode': 'immediate'}],
+                    'label': frame['name'],
+                    'method': 'animate'
+                }
+                for frame in frames
+            ],
+            'transition': {'duration': 0},
+            'currentvalue': {
+                'prefix': 'year: ',
+                'visible': True,
+                'xanchor': 'right'
+            }
+        }]
+    )
+
+    for row, col in positions:
+        fig.update_geos(projection_type='mercator', fitbounds='locations', row=row, col=col)
+
+    county_map = fig.to_dict()
+    county_map['frames'] = frames
+    if out_dir is not None:
+        geometry.write_html_with_geojson(county_map, counties, os.path.join(out_dir, 'county_map_combined.html'), config={'displayModeBar':False}, include_plotlyjs='cdn')
+
+    # county_rate_line = px.line(opi_bup_benz_stim, x='year_filled', y='rx_per1000', color='patient_county', color_discrete_sequence=px.colors.qualitative.Light24, title='cs prescription rate by patient county')
+    # county_rate_line.write_image('data/charts/county_rates.png')
+    # county_rate_line.write_html('data/charts/county_rates.html', include_plotlyjs='cdn')
+
+    # plotly express builds and validates the first two years, enough for its
+    # animation controls, and every year's frame is stamped from the base traces
+    year_values = sorted(pat_county_rates['year_filled'].unique())
+    first_years = pat_county_rates.filter(pl.col('year_filled').is_in(year_values[:2]))
+    colors = dict(zip(pat_county_rates['patient_county'].unique(maintain_order=True), itertools.cycle(px.colors.qualitative.Light24)))
+    opi_bup_county_rate_bubble = px.scatter(
+        first_years,
+        x='opi_rx_per1000',
+        y='bup_rx_per1000',
+        size='population',
+        color='patient_county',
+        color_discrete_map=colors,
+        animation_frame='year_filled',
+        animation_group='patient_county',
+        title='opioid vs buprenorphine prescription rate by patient county'
+    )
+    # sized against the largest population of every year, as plotly express would
+    opi_bup_county_rate_bubble.update_traces(marker=dict(sizemin=5, sizeref=int(pat_county_rates.select(pl.max('population')).item()) / 20 ** 2))
+    bubble = opi_bup_county_rate_bubble.to_dict()
+    base = {trace['name']:trace for trace in bubble['data']}
+    # a county without rows in the first two years gets an empty base trace styled
+    # like the others, so its later frames have a trace to animate
+    template = bubble['data'][0]
+    for county in [county for county in colors if county not in base]:
+        base[county] = {
+            **template,
+            'hovertemplate':template['hovertemplate'].replace(f'patient_county={template["name"]}<br>', f'patient_county={county}<br>'),
+            'ids':[county],
+            'legendgroup':county,
+            'marker':{**template['marker'], 'color':colors[county], 'size':[]},
+            'name':county,
+            'x':[],
+            'y':[],
+        }
+        bubble['data'].append(base[county])
+    bubble['frames'] = []
+    for (year,), year_rates in sorted(pat_county_rates.partition_by('year_filled', as_dict=True).items()):
+        rows = year_rates.partition_by('patient_county', as_dict=True)
+        bubble['frames'].append({
+            'data':[
+                {
+                    **base[county],
+                    'hovertemplate':base[county]['hovertemplate'].replace(f'year_filled={year_values[0]}<br>', f'year_filled={year}<br>'),
+                    'marker':{**base[county]['marker'], 'size':animation.column(rows[(county,)]['population'])},
+                    'x':animation.column(rows[(county,)]['opi_rx_per1000']),
+                    'y':animation.column(rows[(county,)]['bup_rx_per1000']),
+                }
+                for county in base if (county,) in rows
+            ],
+            'name':str(year),
+        })
+    for slider in bubble['layout'].get('sliders', []):
+        slider['steps'] = [{**slider['steps'][0], 'args':[[frame['name']], slider['steps'][0]['args'][1]], 'label':frame['name']} for frame in bubble['frames']]
+    animation.delta_encode(bubble)
+    if out_dir is not None:
+        pio.write_html(bubble, os.path.join(out_dir, 'opi_bup_county_rate_bubble.html'), include_plotlyjs='cdn', validate=False)  # pyright: ignore[reportArgumentType]  # the stub types include_plotlyjs as bool, 'cdn' is documented
+
+    # county_rate_map = px.choropleth_map(
+    #     data_frame=pat_county_rates,
+    #     geojson=counties,
+    #     locations='fips',
+    #     color='rx_per1000',
+    #     map_style='carto-positron',
+    #     center = {"lat": 34.2744, "lon": -111.6602},
+    #     opacity=1,
+    #     zoom=5,
+    #     hover_data={'patient_county':True, 'rx_per1000':':.2f', 'all_cs':':,d', 'population':':,d', 'fips':False},
+    #     title='cs prescription rate by patient county',
+    #     animation_frame='year_filled'
+    # )
+    # county_rate_map.write_html('charts/2024/county_map.html', include_plotlyjs='cdn')
+
+    # images are rendered from the figure itself, not the page, so it needs real geometry
+    for trace in county_map['data']:
+        trace['geojson'] = counties
+    print('county data complete')
+    return {'county_map_combined.html':county_map, 'opi_bup_county_rate_bubble.html':bubble}
+
+def cs_dispensed(cs_disp:pl.DataFrame, out_dir:str|None) -> dict[str, go.Figure]:
+    # ---
+    # cs dispensed
+    # ---
+    print('generating total cs charts...')
+
+    cs_disp_line = px.line(cs_disp, x='year_filled', y='rx_count', title='cs dispensations', range_y=[0,22000000])
+    if out_dir is not None:
+        cs_disp_line.write_html(os.path.join(out_dir, 'total_cs.html'), include_plotlyjs='cdn')
+    print('total cs charts complete')
+    return {'total_cs.html':cs_disp_line}
+
+
+def cs_by_sched(cs_disp_sched:pl.DataFrame, out_dir:str|None) -> dict[str, go.Figure]:
+    # ---
+    # cs by sched
+    # ---
+
+    print('generating cs by sched...')
+
+    cs_disp_sched_tree_map = px.treemap(cs_disp_sched, path=[px.Constant('all drugs'), 'year_filled', 'drug_schedule'], values='rx_count', color='drug_schedule')
+    cs_disp_sched_tree_map.update_traces(marker=dict(cornerradius=5))
+    if out_dir is not None:
+        cs_disp_sched_tree_map.write_html(os.path.join(out_dir, 'cs_disp_sched_tree_map.html'), include_plotlyjs='cdn')
+    print('cs by sched complete')
+    return {'cs_disp_sched_tree_map.html':cs_disp_sched_tree_map}
+
+def obs(opi:pl.DataFrame, benzo:pl.DataFrame, stims:pl.DataFrame, obs_yoy:pl.DataFrame, out_dir:str|None) -> dict[str, go.Figure]:
+    # ---
+    # opi, benzo, stims
+    # ---
+    print('generating opi benzo stims...')
+
+    change = latest_change(obs_yoy, drug=benzo['drug'][0])
+    x1 = change['year_filled']
+    x0 = x1 - 1
+    y0, y1 = change['prev'], change['rx_count']
+
+    layout = dict(
+        hoversubplots='axis',
+        title=dict(text='dispensations by drug type'),
+        hovermode='x',
+        grid=dict(rows=3, columns=1),
+        shapes=[
+            dict(type='rect',
+                x0=x0, y0=y0, x1=x1, y1=y1,
+                fillcolor='MediumPurple',
+                line_color='MediumPurple',
+                opacity=0.25,
+                xref='x', yref='y2'
+            )
+        ],
+        annotations=[
+            dict(
+                x=x1 - 0.01,
+                y=y0 + (y1 - y0) * 0.03,
+                text=f'{change["drug"]} increase: {change["delta_label"]}',
+                showarrow=False,
+                font=dict(color='MediumPurple', size=10),
+                align='right',
+                xanchor='right',
+                yanchor='bottom',
+                xref='x', yref='y2'
+            )
+        ]
+    )
+
+    data = [
+        go.Scatter(x=opi['year_filled'], y = opi['rx_count'], xaxis='x', yaxis='y', name='opioid', hovertemplate='%{y:.3s}'),
+        go.Scatter(x=benzo['year_filled'], y = benzo['rx_count'], xaxis='x', yaxis='y2', name='benzodiazepine', hovertemplate='%{y:.3s}'),
+        go.Scatter(x=stims['year_filled'], y = stims['rx_count'], xaxis='x', yaxis='y3', name='stimulant', hovertemplate='%{y:.3s}'),
+    ]
+
+    obs_stacked = go.Figure(data=data, layout=layout)
+
+    if out_dir is not None:
+        obs_stacked.write_html(os.path.join(out_dir, 'obs_stacked.html'))
+    print('opi benzo stims generated')
+    return {'obs_stacked.html':obs_stacked}
+
+def oos_rx(benzo_oos:pl.DataFrame, andro_oos:pl.DataFrame, oos_yoy:pl.DataFrame, out_dir:str|None) -> dict[str, go.Figure]:
+    # ---
+    # oos_rx
+    # ---
+    print('generating oos...')
+
+    benzo_oos_fig = px.line(benzo_oos, x='year_filled', y='rx_count', color='presc_az', title=f'{benzo_oos["drug type"][0]} dispensations by prescriber state', hover_data={'presc_az':True, 'year_filled':True, 'rx_count':':.3s'})
+    # benzo_oos_fig.add_vrect(x0=benzo_oos['year_filled'].max() - 1, x1=benzo_oos['year_filled'].max(),
+    #                         annotation_text='increase in out of state rx', annotation_position='bottom right',
+    #                         fillcolor='red', opacity=0.25, line_width=0)
+    layout = dict(
+        hoversubplots='axis',
+        hovermode='x'
+    )
+    benzo_oos_fig.update_layout(layout)
+
+    out_of_state = latest_change(oos_yoy, drug=benzo_oos['drug type'][0], presc_az=False)
+    x1 = out_of_state['year_filled']
+    x0 = x1 - 1
+    y0, y1 = out_of_state['prev'], out_of_state['rx_count']
+
+    benzo_oos_fig.add_shape(type='rect',
+        x0=x0, y0=y0, x1=x1, y1=y1,
+        fillcolor='MediumPurple',
+        line_color='MediumPurple',
+        opacity=0.25
+    )
+    benzo_oos_fig.update_shapes(dict(xref='x', yref='y'))
+    benzo_oos_fig.add_annotation(
+        x=x1 - 0.01,
+        y=y0 + (y1 - y0) * 0.03,
+        text=f'out of state increase: {out_of_state["delta_label"]}',
+        showarrow=False,
+        font=dict(color='MediumPurple', size=10),
+        align='right',
+        xanchor='right',
+        yanchor='bottom',
+    )
+    if out_dir is not None:
+        benzo_oos_fig.write_html(os.path.join(out_dir, 'benzo_oos.html'), include_plotlyjs='cdn')
+
+    print('benzo oos complete')
+
+    andro_oos_fig = px.line(andro_oos, x='year_filled', y='rx_count', color='presc_az', title=f'{andro_oos["drug type"][0]} dispensations by prescriber state', hover_data={'presc_az':True, 'year_filled':True, 'rx_count':':.3s'})
+    layout = dict(
+        hoversubplots='axis',
+        hovermode='x'
+    )
+    andro_oos_fig.update_layout(layout)
+
+    out_of_state = latest_change(oos_yoy, drug=andro_oos['drug type'][0], presc_az=False)
+    in_state = latest_change(oos_yoy, drug=andro_oos['drug type'][0], presc_az=True)
+    x1 = out_of_state['year_filled']
+    x0 = x1 - 1
+
+    andro_oos_fig.add_vrect(x0=x0, x1=x1, fillcolor='orange', opacity=0.25, line_width=0, annotation_text=f'out of state increase: {out_of_state["delta_label"]}', annotation_position='bottom right', annotation_font_color='red', annotation_font_size=10)
+    andro_oos_fig.add_vrect(x0=x0, x1=x1, fillcolor='orange', opacity=0, line_width=0, annotation_text=f'in state state increase: {in_state["delta_label"]}', annotation_position='top left', annotation_font_color='green', annotation_font_size=10)
+    if out_dir is not None:
+        andro_oos_fig.write_html(os.path.join(out_dir, 'andro_oos.html'), include_plotlyjs='cdn')
+
+    print('andro oos complete')
+
+    print('oos complete')
+    return {'benzo_oos.html':benzo_oos_fig, 'andro_oos.html':andro_oos_fig}
+
+def bup(bup_rx:pl.DataFrame, out_dir:str|None) -> dict[str, go.Figure]:
+    # ---
+    # bup
+    # ---
+    print('generating bup...')
+
+    bup_fig = px.line(bup_rx, x='year_filled', y='rx_count', title='buprenorphine dispensations by year', hover_data={'year_filled':True, 'rx_count':':.3s'})
+    if out_dir is not None:
+        bup_fig.write_html(os.path.join(out_dir, 'bup.html'), include_plotlyjs='cdn')
+
+    print('buprenorphine complete')
+    return {'bup.html':bup_fig}
+
+def opi_pills(pills:pl.DataFrame, out_dir:str|None) -> dict[str, go.Figure]:
+    print('generating opi_pills...')
+
+    opi_pp = px.line(pills, x='year_filled', y='pills_per_rx', title='opioid pills per dispensation', hover_data={'year_filled':True, 'pills_per_rx':':.3s'})
+    if out_dir is not None:
+        opi_pp.write_html(os.path.join(out_dir, 'opi_pp.html'), include_plotlyjs='cdn')
+
+    layout = dict(
+        hoversubplots='axis',
+        title=dict(text='opioid pills and dispensations'),
+        hovermode='x',
+        grid=dict(rows=3, columns=1)
+    )
+
+    data = [
+        go.Scatter(x=pills['year_filled'], y = pills['rx_count'], xaxis='x', yaxis='y', name='dispensations', hovertemplate='%{y:.3s}'),
+        go.Scatter(x=pills['year_filled'], y = pills['pills_count'], xaxis='x', yaxis='y2', name='pills', hovertemplate='%{y:.3s}'),
+        go.Scatter(x=pills['year_filled'], y = pills['pills_per_rx'], xaxis='x', yaxis='y3', name='pills per dispensation', hovertemplate='%{y:.3s}'),
+    ]
+
+    opi_pills_per = go.Figure(data=data, layout=layout)
+    if out_dir is not None:
+        opi_pills_per.write_html(os.path.join(out_dir, 'opi_pp_stacked.html'), include_plotlyjs='cdn')
+    print('opi_pills complete')
+    return {'opi_pp.html':opi_pp, 'opi_pp_stacked.html':opi_pills_per}
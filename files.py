@@ -0,0 +1,46 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any
+
+
+def sha256(path:str) -> str:
+    """
+    returns:
+        the hex sha256 of a file's bytes, read a block at a time
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_json(path:str) -> dict:
+    """
+    returns:
+        the json object in `path`, or an empty dict if the file is missing or
+        not valid json
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def write_json(path:str, obj:Any) -> None:
+    """
+    writes `obj` as indented json through a unique temporary file in the same
+    directory, so readers see the old file or the new one, never part of one, and
+    concurrent writers never share a temporary file
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'{os.path.basename(path)}.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(obj, f, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -0,0 +1,129 @@
+import json
+import math
+import re
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+
+SHARED_GEOJSON = '__shared_geojson__'
+
+
+def subset_features(geojson:dict, state_fips:str) -> dict:
+    """
+    keeps only the counties of one state
+
+    args:
+        geojson: a county FeatureCollection with 5 digit fips feature ids
+        state_fips: 2 digit state fips code
+
+    returns:
+        a FeatureCollection with just the features whose id starts with `state_fips`
+    """
+    return {
+        'type':'FeatureCollection',
+        'features':[feature for feature in geojson['features'] if str(feature['id']).startswith(state_fips)]
+    }
+
+def _simplify_ring(ring:list, tolerance:float, precision:int) -> list:
+    # douglas-peucker, iterative so large rings can't hit the recursion limit
+    keep = [False] * len(ring)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(ring) - 1)]
+    while stack:
+        start, end = stack.pop()
+        (x0, y0), (x1, y1) = ring[start][:2], ring[end][:2]
+        dx, dy = x1 - x0, y1 - y0
+        length = math.hypot(dx, dy)
+        max_dist, max_i = 0.0, 0
+        for i in range(start + 1, end):
+            x, y = ring[i][:2]
+            if length == 0:
+                dist = math.hypot(x - x0, y - y0)
+            else:
+                dist = abs(dy * x - dx * y + x1 * y0 - y1 * x0) / length
+            if dist > max_dist:
+                max_dist, max_i = dist, i
+        if max_dist > tolerance:
+            keep[max_i] = True
+            stack.extend([(start, max_i), (max_i, end)])
+
+    simplified = []
+    for point, kept in zip(ring, keep):
+        quantized = [round(point[0], precision), round(point[1], precision)]
+        if kept and (not simplified or quantized != simplified[-1]):
+            simplified.append(quantized)
+    # a closed ring needs at least 4 positions, fall back to quantizing only
+    if len(simplified) < 4:
+        simplified = [[round(point[0], precision), round(point[1], precision)] for point in ring]
+    return simplified
+
+def simplify(geojson:dict, tolerance:float=0.002, precision:int=3) -> dict:
+    """
+    simplifies and quantizes every polygon ring in a FeatureCollection
+
+    rings are simplified independently, so neighbouring counties can open hairline
+    gaps at large tolerances, the defaults (about 200m and 100m) are well below what
+    shows at state zoom
+
+    args:
+        geojson: a FeatureCollection of Polygon and MultiPolygon features
+        tolerance: douglas-peucker tolerance in degrees
+        precision: decimal places kept in each coordinate
+
+    returns:
+        a new FeatureCollection with simplified geometry, only the feature ids kept
+    """
+    features = []
+    for feature in geojson['features']:
+        geometry = feature['geometry']
+        if geometry['type'] == 'Polygon':
+            coordinates:Any = [_simplify_ring(ring, tolerance, precision) for ring in geometry['coordinates']]
+        else:
+            coordinates = [[_simplify_ring(ring, tolerance, precision) for ring in polygon] for polygon in geometry['coordinates']]
+        features.append({'type':'Feature', 'id':feature['id'], 'geometry':{'type':geometry['type'], 'coordinates':coordinates}})
+    return {'type':'FeatureCollection', 'features':features}
+
+def prepare_state_geometry(geojson:dict, state_fips:str, tolerance:float=0.002, precision:int=3) -> dict:
+    """
+    subsets a us county FeatureCollection to one state, then simplifies and quantizes it
+
+    args:
+        geojson: a county FeatureCollection with 5 digit fips feature ids
+        state_fips: 2 digit state fips code
+        tolerance: douglas-peucker tolerance in degrees
+        precision: decimal places kept in each coordinate
+
+    returns:
+        a small FeatureCollection of the state's counties
+    """
+    return simplify(subset_features(geojson, state_fips), tolerance, precision)
+
+def write_html_with_geojson(fig:'go.Figure|dict', geojson:dict, path:str, **kwargs:Any) -> int:
+    """
+    writes a figure whose choropleth traces use `geojson=SHARED_GEOJSON`, embedding
+    the geometry once in the page and pointing every trace at it, instead of plotly
+    serializing a copy per trace
+
+    args:
+        fig: the figure to write, or a figure dict, which is written as is without
+            validating it again
+        geojson: the geometry the traces share
+        path: output html path
+        kwargs: optional kwargs to pass to plotly `to_html()`
+
+    returns:
+        the number of bytes written
+    """
+    import plotly.io as pio
+    html = pio.to_html(fig, full_html=True, validate=False, **kwargs)
+    html, count = re.subn(rf'"geojson":\s*"{SHARED_GEOJSON}"', f'"geojson":{SHARED_GEOJSON}', html)
+    if count == 0:
+        raise ValueError(f'no trace uses geojson={SHARED_GEOJSON!r}')
+    script = f'<script type="text/javascript">var {SHARED_GEOJSON} = {json.dumps(geojson, separators=(",", ":"))};</script>'
+    html = html.replace('<body>', f'<body>\n    {script}', 1)
+    data = html.encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
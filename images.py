@@ -0,0 +1,102 @@
+import os
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from telemetry import span
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+
+@dataclass(frozen=True)
+class ImageOptions:
+    """
+    static image export settings for the printed report
+
+    attributes:
+        formats: image formats written for every chart, any of png, jpeg, webp,
+            svg, pdf or eps
+        width: image width in layout pixels
+        height: image height in layout pixels
+        scale: multiplier from layout pixels to image pixels for raster formats
+        sizes: optional (width, height) per chart file name, eg
+            {'county_map_combined.html':(1800, 1200)}
+        subdir: directory under the chart directory the images are written to
+    """
+    formats:tuple[str, ...] = ('png',)
+    width:int = 1200
+    height:int = 800
+    scale:float = 2.0
+    sizes:dict[str, tuple[int, int]] = field(default_factory=dict)
+    subdir:str = 'img'
+
+    def size(self, chart:str) -> tuple[int, int]:
+        return self.sizes.get(chart, (self.width, self.height))
+
+    def paths(self, out_dir:str, chart:str) -> list[str]:
+        """
+        args:
+            out_dir: the chart directory
+            chart: the chart's html file name
+
+        returns:
+            the image paths written for the chart, one per format
+        """
+        stem = os.path.splitext(chart)[0]
+        return [os.path.join(out_dir, self.subdir, f'{stem}.{fmt}') for fmt in self.formats]
+
+
+_scope:Any = None
+
+def scope() -> Any:
+    """
+    the kaleido renderer for this process, started on first use and kept warm so
+    chromium starts once per process instead of once per figure
+
+    returns:
+        a kaleido `PlotlyScope`
+    """
+    global _scope
+    if _scope is None:
+        # imported here so runs without image export never load kaleido
+        import plotly
+        from kaleido.scopes.plotly import PlotlyScope
+
+        # plotly's own bundle, kaleido's default is the cdn's plotly-latest, which is
+        # plotly.js 1 and can't read the typed arrays (`bdata`) plotly 6 writes
+        _scope = PlotlyScope(plotlyjs=os.path.join(os.path.dirname(plotly.__file__), 'package_data', 'plotly.min.js'))
+    return _scope
+
+def export_images(figures:dict[str, 'go.Figure|dict'], out_dir:str, options:ImageOptions) -> dict[str, float]:
+    """
+    writes every figure in every configured format through the warm renderer
+
+    animated figures are drawn as their first frame
+
+    args:
+        figures: dict of chart html file name to figure or figure dict, as
+            returned by the section builders
+        out_dir: the chart directory
+        options: formats and sizes to export
+
+    returns:
+        a dict of chart file name to seconds spent exporting it
+    """
+    os.makedirs(os.path.join(out_dir, options.subdir), exist_ok=True)
+    timings = {}
+    for chart, fig in figures.items():
+        start = time.perf_counter()
+        width, height = options.size(chart)
+        with span('images.export', chart=chart, formats=options.formats) as export:
+            # serialize once, each format reuses the same dict
+            fig_dict = fig if isinstance(fig, dict) else fig.to_dict()
+            for fmt, path in zip(options.formats, options.paths(out_dir, chart)):
+                data = scope().transform(fig_dict, format=fmt, width=width, height=height, scale=options.scale)
+                with open(f'{path}.tmp', 'wb') as f:
+                    f.write(data)
+                os.replace(f'{path}.tmp', path)
+                export.bytes_written += len(data)
+        timings[chart] = time.perf_counter() - start
+        print(f'exported {chart} as {", ".join(options.formats)} in {timings[chart]:.2f}s')
+    return timings
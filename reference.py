@@ -0,0 +1,315 @@
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any
+
+import polars as pl
+from dotenv import load_dotenv
+
+from files import read_json, sha256, write_json
+from tableau import OfflineError
+from telemetry import span
+
+if TYPE_CHECKING:
+    import requests
+
+
+COUNTIES_URL = 'https://raw.githubusercontent.com/plotly/datasets/master/geojson-counties-fips.json'
+FIPS_URL = 'https://transition.fcc.gov/oet/info/maps/census/fips/fips.txt'
+ACS_URL = 'https://api.census.gov/data/{vintage}/acs/acs5'
+FIRST_ACS5 = 2009
+LATEST_ACS5 = 2023  # the newest release the report uses, a year's release comes out the december after it
+
+
+def parse_fips(fips_txt:str) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    parses the fcc `fips.txt` listing with vectorized polars string ops
+
+    args:
+        fips_txt: the text of `fips.txt`
+
+    returns:
+        a tuple of (states, counties) DataFrames, with columns `fips` and `state`
+        or `fips` and `county`
+    """
+    sections = re.split(r'-+\s+-+', fips_txt)
+
+    def parse_section(section:str, name_col:str) -> pl.DataFrame:
+        return (
+            pl.DataFrame({'line':section.strip().splitlines()})
+            # the listing ends at the first blank line, the next section's header follows
+            .filter((pl.col('line').str.strip_chars() == '').cum_sum() == 0)
+            .select(pl.col('line').str.strip_chars().str.extract_groups(r'^(\S+)\s{2,}(.+)$'))
+            .unnest('line')
+            .rename({'1':'fips', '2':name_col})
+        )
+
+    return parse_section(sections[1], 'state'), parse_section(sections[2], 'county')
+
+
+def acs5_vintage(year:int, latest:int=LATEST_ACS5) -> int:
+    """
+    args:
+        year: a data year
+        latest: the newest acs 5 year release to use
+
+    returns:
+        the acs 5 year release whose estimates end in `year`, clamped to the
+        releases available
+    """
+    return min(max(year, FIRST_ACS5), latest)
+
+
+class ReferenceData:
+    """
+    downloads the county geojson, fcc fips codes and acs county populations once
+    and keeps them in `cache_dir` with a manifest of checksums
+
+    the geojson is stored compact and the tabular sources as parquet, cached files
+    are used without any request until they are older than `ttl`, then revalidated
+    with a conditional request where the source supports it
+
+    the source urls are class attributes so they can be pointed elsewhere, eg at
+    the benchmark's stand in server
+    """
+    counties_url = COUNTIES_URL
+    fips_url = FIPS_URL
+    acs_url = ACS_URL
+
+    def __init__(self, cache_dir:str='.cache/reference', ttl:float=30*86400.0, refresh:bool=False, offline:bool=False):
+        """
+        args:
+            cache_dir: directory for the cached files and `manifest.json`
+            ttl: seconds before a cached source is revalidated
+            refresh: if True, revalidate every source regardless of age
+            offline: if True, never make a request, a missing or corrupt file
+                raises `OfflineError`
+        """
+        if refresh and offline:
+            raise ValueError('refresh and offline are mutually exclusive')
+        load_dotenv()
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.refresh = refresh
+        self.offline = offline
+        self._session:requests.Session|None = None
+        self._lock = threading.Lock()
+        # one per source, so threads needing the same source wait for one download
+        self._source_locks:dict[str, threading.Lock] = {}
+        # sources downloaded or revalidated by this instance, not checked again with `refresh`
+        self._checked:set[str] = set()
+
+    @property
+    def session(self) -> 'requests.Session':
+        """
+        the http session, created (and requests imported) on first download
+        """
+        with self._lock:
+            if self._session is None:
+                import requests
+                self._session = requests.Session()
+            return self._session
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.cache_dir, 'manifest.json')
+
+    def _read_manifest(self) -> dict:
+        return read_json(self._manifest_path)
+
+    def _update_manifest(self, name:str, entry:dict[str, Any]) -> None:
+        with self._lock:
+            manifest = self._read_manifest()
+            manifest[name] = entry
+            write_json(self._manifest_path, manifest)
+
+    def _cached(self, name:str, file:str, url:str, write:Callable[[bytes, str], None], params:dict|None=None) -> str:
+        """
+        returns the path of a cached source, downloading or revalidating it if needed
+
+        args:
+            name: manifest entry name
+            file: file name in `cache_dir`
+            url: source url
+            write: callable that converts the downloaded bytes and writes them to a path
+            params: optional query parameters, a `key` parameter is never recorded
+
+        returns:
+            path of the cached file
+        """
+        path = os.path.join(self.cache_dir, file)
+        with self._lock:
+            source_lock = self._source_locks.setdefault(name, threading.Lock())
+        # the manifest is read inside the lock, a source another thread just fetched is a hit
+        with source_lock:
+            return self._fetch_source(name, path, url, write, params)
+
+    def _fetch_source(self, name:str, path:str, url:str, write:Callable[[bytes, str], None], params:dict|None) -> str:
+        entry = self._read_manifest().get(name)
+        if entry is not None and not (os.path.exists(path) and sha256(path) == entry['sha256']):
+            # missing or corrupt, downloaded again as if never cached
+            entry = None
+        if self.offline:
+            if entry is None:
+                raise OfflineError(f'{name} is not cached, run once without --offline to download it')
+            return path
+        if entry is not None and (name in self._checked or not self.refresh and time.time() - entry['checked_at'] < self.ttl):
+            return path
+
+        headers = {}
+        if entry is not None and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry is not None and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        with span('reference.download', source=name) as download:
+            response = self.session.get(url, params=params, headers=headers, timeout=120)
+            download.bytes_downloaded = len(response.content)
+            if entry is not None and response.status_code == 304:
+                self._update_manifest(name, {**entry, 'checked_at':time.time()})
+                self._checked.add(name)
+                return path
+            if response.status_code != 200:
+                sys.exit(f'error: {response.status_code}, {response.text}')
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=f'{os.path.basename(path)}.')
+            os.close(fd)
+            try:
+                write(response.content, tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            download.bytes_written = os.path.getsize(path)
+        now = time.time()
+        self._update_manifest(name, {
+            'url':url,
+            'params':{k:v for k,v in (params or {}).items() if k != 'key'},
+            'file':os.path.basename(path),
+            'sha256':sha256(path),
+            'etag':response.headers.get('ETag'),
+            'last_modified':response.headers.get('Last-Modified'),
+            'fetched_at':now,
+            'checked_at':now,
+        })
+        self._checked.add(name)
+        return path
+
+    def counties(self) -> dict:
+        """
+        returns:
+            the us counties geojson, features keyed by 5 digit fips `id`
+        """
+        def write(content:bytes, path:str) -> None:
+            with open(path, 'w') as f:
+                json.dump(json.loads(content), f, separators=(',', ':'))
+
+        with open(self._cached('counties', 'counties.geojson', self.counties_url, write)) as f:
+            return json.load(f)
+
+    def _fips_path(self) -> str:
+        def write(content:bytes, path:str) -> None:
+            states, counties = parse_fips(content.decode('latin-1'))
+            pl.concat([
+                states.select('fips', pl.col('state').alias('name'), pl.lit('state').alias('level')),
+                counties.select('fips', pl.col('county').alias('name'), pl.lit('county').alias('level')),
+            ]).write_parquet(path)
+
+        return self._cached('fips', 'fips.parquet', self.fips_url, write)
+
+    def fips_states(self) -> pl.DataFrame:
+        """
+        returns:
+            a DataFrame of 2 digit state `fips` and upper case `state` name
+        """
+        return pl.read_parquet(self._fips_path()).filter(pl.col('level') == 'state').select('fips', pl.col('name').alias('state'))
+
+    def fips_counties(self) -> pl.DataFrame:
+        """
+        returns:
+            a DataFrame of 5 digit county `fips` and `county` name
+        """
+        return pl.read_parquet(self._fips_path()).filter(pl.col('level') == 'county').select('fips', pl.col('name').alias('county'))
+
+    def state_fips(self, state:str) -> str:
+        """
+        args:
+            state: upper case state name as listed in `fips.txt`, eg 'ARIZONA'
+
+        returns:
+            the 2 digit state fips code
+        """
+        return self.fips_states().filter(pl.col('state') == state)['fips'].item()
+
+    def _acs5_path(self, vintage:int) -> str:
+        # every county of every state in one request, so any set of states is read
+        # from the one cached release
+        params = {
+            'get':'B01003_001E',
+            'for':'county:*',
+            'in':'state:*',
+            'key':os.environ.get('CENSUS_API_KEY', 'CENSUS_API_KEY missing from .env file')
+        }
+
+        def write(content:bytes, path:str) -> None:
+            header, *rows = json.loads(content)
+            (
+                pl.DataFrame(rows, schema=header, orient='row')
+                .select(
+                    (pl.col('state') + pl.col('county')).alias('fips'),
+                    pl.col('B01003_001E').cast(pl.Int64).alias('population'),
+                )
+                .write_parquet(path)
+            )
+
+        # acs releases don't change, the ttl only applies to catch corrections
+        return self._cached(f'acs5_{vintage}', f'acs5_{vintage}.parquet', self.acs_url.format(vintage=vintage), write, params)
+
+    def county_population(self, states:list[str], years:range|list[int], latest:int=LATEST_ACS5) -> pl.DataFrame:
+        """
+        gets acs 5 year county populations for each year from the release ending
+        that year, years after `latest` use `latest` and years before the first
+        release use the first
+
+        each release is one request for every state, the releases are pulled at once
+
+        args:
+            states: upper case state names as listed in `fips.txt`, eg ['ARIZONA']
+            years: the years populations are needed for, eg the `year_filled`s
+            latest: the newest acs 5 year release to use
+
+        returns:
+            a DataFrame of county `fips`, upper case `state` name, upper case
+            `county` name without the ' COUNTY' suffix, `year_filled`, the acs
+            `vintage` and `population`, county names repeat across states
+        """
+        vintages = {year:acs5_vintage(year, latest) for year in years}
+        state_fips = self.fips_states().filter(pl.col('state').is_in(states))
+        releases = sorted(set(vintages.values()))
+        with ThreadPoolExecutor(max_workers=max(1, len(releases))) as pool:
+            paths = dict(zip(releases, pool.map(self._acs5_path, releases)))
+        # no years means no releases, polars can't concat nothing
+        populations = pl.concat([
+            pl.read_parquet(path).with_columns(pl.lit(vintage, pl.Int32).alias('vintage')) for vintage, path in paths.items()
+        ]) if paths else pl.DataFrame(schema={'fips':pl.String, 'population':pl.Int64, 'vintage':pl.Int32})
+        return (
+            pl.DataFrame({'year_filled':list(vintages), 'vintage':list(vintages.values())}, schema={'year_filled':pl.Int64, 'vintage':pl.Int32})
+            .join(populations.filter(pl.col('fips').str.slice(0, 2).is_in(state_fips['fips'])), on='vintage')
+            .join(state_fips.rename({'fips':'state_fips'}), left_on=pl.col('fips').str.slice(0, 2), right_on='state_fips', how='left')
+            .join(self.fips_counties(), on='fips', how='left')
+            .select(
+                'fips',
+                'state',
+                pl.col('county').str.to_uppercase().str.strip_suffix(' COUNTY'),
+                'year_filled',
+                'vintage',
+                'population',
+            )
+            .sort('fips', 'year_filled')
+        )
@@ -0,0 +1,260 @@
+import ast
+import hashlib
+import importlib
+import importlib.metadata
+import importlib.util
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+
+import polars as pl
+
+from files import read_json, write_json
+from images import ImageOptions, export_images
+from telemetry import Span, span, tracer
+
+
+@dataclass(frozen=True)
+class Section:
+    """
+    a group of charts rendered together from the collected report frames
+
+    builders live in `figures`, which imports plotly, so they are named here and
+    only imported when a section is rendered
+
+    attributes:
+        render: name of the chart builder in `figures`, called with its inputs in
+            order then `out_dir` (None to build without writing), returning its
+            figures keyed by output file name
+        inputs: names of the frames from `derive()` (or other fetched data, like
+            `counties`) the builder takes
+        outputs: file names the builder writes in `out_dir`
+    """
+    render:str
+    inputs:tuple[str, ...]
+    outputs:tuple[str, ...]
+
+    def builder(self) -> Callable[..., dict[str, Any]]:
+        return getattr(importlib.import_module('figures'), self.render)
+
+
+SECTIONS = {
+    'county_data':Section('county_data', ('pat_county_rates', 'counties'), ('county_map_combined.html', 'opi_bup_county_rate_bubble.html')),
+    'cs_dispensed':Section('cs_dispensed', ('cs_disp',), ('total_cs.html',)),
+    # 'cs_by_sched':Section('cs_by_sched', ('cs_disp_sched',), ('cs_disp_sched_tree_map.html',)), # not interesting this year
+    'obs':Section('obs', ('opi', 'benzo', 'stims', 'obs_yoy'), ('obs_stacked.html',)),
+    'oos_rx':Section('oos_rx', ('benzo_oos', 'andro_oos', 'oos_yoy'), ('benzo_oos.html', 'andro_oos.html')),
+    'bup':Section('bup', ('bup_rx',), ('bup.html',)),
+    'opi_pills':Section('opi_pills', ('pills',), ('opi_pp.html', 'opi_pp_stacked.html')),
+}
+# code every builder depends on, a change here rebuilds every section
+SHARED_CODE = ('figures:latest_change', 'animation', 'geometry')
+
+
+def _source(code:str) -> str:
+    # read from the file rather than with inspect, so checking whether anything
+    # needs rendering doesn't import plotly
+    module, _, attr = code.partition(':')
+    spec = importlib.util.find_spec(module)
+    if spec is None or spec.origin is None:
+        raise ModuleNotFoundError(module)
+    with open(spec.origin) as f:
+        source = f.read()
+    if not attr:
+        return source
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.FunctionDef) and node.name == attr:
+            return ast.get_source_segment(source, node) or ''
+    raise AttributeError(f'{module} has no function {attr}')
+
+def _input_digest(value:Any) -> str:
+    digest = hashlib.sha256()
+    if isinstance(value, pl.DataFrame):
+        digest.update(str(value.schema).encode())
+        digest.update(value.hash_rows(seed=0).to_numpy().tobytes())
+    else:
+        digest.update(json.dumps(value, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+def section_key(name:str, inputs:dict[str, Any], images:ImageOptions|None=None) -> str:
+    """
+    hashes everything a section's output depends on: its input frames, the source
+    of its builder and the shared helpers, the image settings, and the polars and
+    plotly versions
+
+    args:
+        name: `SECTIONS` key
+        inputs: dict of input name to a DataFrame or other input
+        images: optional static image export settings
+
+    returns:
+        a hex digest that changes whenever the section's charts could
+    """
+    section = SECTIONS[name]
+    digest = hashlib.sha256()
+    # hash_rows is only stable within a polars version
+    digest.update(f'{pl.__version__} {importlib.metadata.version("plotly")} {images!r}'.encode())
+    for code in (f'figures:{section.render}', *SHARED_CODE):
+        digest.update(_source(code).encode())
+    for key in section.inputs:
+        digest.update(f'{key}={_input_digest(inputs[key])}'.encode())
+    return digest.hexdigest()
+
+def section_outputs(name:str, out_dir:str, images:ImageOptions|None=None) -> list[str]:
+    """
+    args:
+        name: `SECTIONS` key
+        out_dir: directory the charts are written to
+        images: optional static image export settings
+
+    returns:
+        the paths of every file the section writes, html and images
+    """
+    outputs = []
+    for chart in SECTIONS[name].outputs:
+        outputs.append(os.path.join(out_dir, chart))
+        if images is not None:
+            outputs.extend(images.paths(out_dir, chart))
+    return outputs
+
+def render_section(name:str, inputs:dict[str, Any], out_dir:str, images:ImageOptions|None=None) -> float:
+    """
+    renders one section, frames given as arrow ipc paths are read memory mapped
+
+    args:
+        name: `SECTIONS` key
+        inputs: dict of input name to a DataFrame, an arrow ipc path or any other
+            input the builder takes
+        out_dir: directory the charts are written to
+        images: optional static image export settings, images are exported from
+            the built figures through this process's warm kaleido renderer
+
+    returns:
+        seconds spent rendering
+    """
+    start = time.perf_counter()
+    section = SECTIONS[name]
+    with span(f'render.{name}', report=out_dir) as render:
+        args = [pl.read_ipc(inputs[key]) if isinstance(inputs[key], str) else inputs[key] for key in section.inputs]
+        render.rows = sum(arg.height for arg in args if isinstance(arg, pl.DataFrame))
+        figures = section.builder()(*args, out_dir)
+        render.bytes_written = sum(os.path.getsize(os.path.join(out_dir, chart)) for chart in section.outputs)
+    if images is not None:
+        export_images(figures, out_dir, images)
+    return time.perf_counter() - start
+
+def _render_job(name:str, inputs:dict[str, Any], out_dir:str, images:ImageOptions|None) -> tuple[float, list[Span]]:
+    # runs in a worker, the spans go back with the result to the parent's tracer
+    mark = tracer.mark()
+    seconds = render_section(name, inputs, out_dir, images)
+    return seconds, tracer.since(mark)
+
+def _render(jobs:list[tuple[str, str]], reports:dict[str, dict[str, Any]], max_workers:int, images:ImageOptions|None) -> dict[tuple[str, str], float]:
+    if max_workers <= 1:
+        return {(out_dir, name):render_section(name, reports[out_dir], out_dir, images) for out_dir, name in jobs}
+    spill_dir = tempfile.mkdtemp(prefix='frames-')
+    try:
+        shared:dict[str, dict[str, Any]] = {}
+        with span('render.spill') as spill:
+            for i, out_dir in enumerate(sorted({out_dir for out_dir, _ in jobs})):
+                inputs = reports[out_dir]
+                needed = {key for job_dir, name in jobs if job_dir == out_dir for key in SECTIONS[name].inputs}
+                shared[out_dir] = {}
+                for key in needed:
+                    if isinstance(inputs[key], pl.DataFrame):
+                        shared[out_dir][key] = os.path.join(spill_dir, f'{i}-{key}.arrow')
+                        inputs[key].write_ipc(shared[out_dir][key], compression='uncompressed')
+                        spill.rows += inputs[key].height
+                        spill.bytes_written += os.path.getsize(shared[out_dir][key])
+                    else:
+                        shared[out_dir][key] = inputs[key]
+        # spawn, forking a process that has run polars and thread pools can deadlock
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {
+                (out_dir, name):pool.submit(_render_job, name, {key:shared[out_dir][key] for key in SECTIONS[name].inputs}, out_dir, images)
+                for out_dir, name in jobs
+            }
+            timings = {}
+            for job, future in futures.items():
+                timings[job], spans = future.result()
+                tracer.extend(spans)
+            return timings
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+def render_all(
+    reports:dict[str, dict[str, Any]],
+    names:list[str]|None=None,
+    max_workers:int|None=None,
+    manifest_path:str|None='.cache/render_manifest.json',
+    force:bool=False,
+    images:ImageOptions|None=None
+) -> dict[tuple[str, str], float]:
+    """
+    renders the sections whose inputs or code changed since they were last written,
+    for one or more reports, in a process pool since building the figures and
+    serializing the html is cpu bound
+
+    a section is skipped when its `section_key()` matches the one recorded in the
+    manifest and all its outputs exist, so unchanged charts are not rewritten
+    (plotly gives every write new div ids, which would show up as a diff)
+
+    DataFrames are written once as uncompressed arrow ipc and memory mapped by the
+    workers instead of being pickled to each of them, with `images` each worker
+    keeps one kaleido renderer warm for all the charts it exports
+
+    args:
+        reports: dict of the directory a report's charts are written to, eg
+            'charts/2024', to its inputs, a dict of input name to a DataFrame or
+            other input, eg the collected frames plus `counties`
+        names: optional `SECTIONS` keys to render, defaults to all of them
+        max_workers: the most sections rendering at one time, defaults to the cpu
+            count, 1 renders in this process
+        manifest_path: json file recording the key each output was rendered from,
+            None to always render
+        force: if True, render every section regardless of the manifest
+        images: optional static image export settings, None for html only
+
+    returns:
+        a dict of rendered (report directory, section name) to seconds spent
+        rendering it
+    """
+    names = names or list(SECTIONS)
+    jobs = [(out_dir, name) for out_dir in reports for name in names]
+    manifest = read_json(manifest_path) if manifest_path else {}
+    keys = {(out_dir, name):section_key(name, reports[out_dir], images) for out_dir, name in jobs} if manifest_path else {}
+    stale = [
+        (out_dir, name) for out_dir, name in jobs
+        if force
+        or not manifest_path
+        or manifest.get(os.path.join(out_dir, name), {}).get('key') != keys[out_dir, name]
+        or not all(os.path.exists(output) for output in section_outputs(name, out_dir, images))
+    ]
+    skipped = [os.path.join(*job) for job in jobs if job not in stale]
+    if skipped:
+        print(f'unchanged, skipped: {", ".join(skipped)}')
+    if not stale:
+        return {}
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(stale))
+    start = time.perf_counter()
+    timings = _render(stale, reports, max_workers, images)
+    if manifest_path:
+        # read again so runs for other reports in the meantime aren't lost
+        manifest = read_json(manifest_path)
+        for out_dir, name in stale:
+            manifest[os.path.join(out_dir, name)] = {
+                'key':keys[out_dir, name],
+                'outputs':section_outputs(name, out_dir, images),
+                'rendered_at':time.time(),
+            }
+        write_json(manifest_path, manifest)
+    print(f'rebuilt {len(stale)} sections in {time.perf_counter() - start:.2f}s ({max_workers} workers): {", ".join(os.path.join(*job) for job in stale)}')
+    return timings
@@ -0,0 +1,224 @@
+import argparse
+import dataclasses
+import functools
+import html
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import polars as pl
+
+import geometry
+import sections
+import tableau
+import yearly_figures
+from datasets import DATASETS, DRUG_TYPES
+from extract_cache import ExtractCache
+from reference import ReferenceData
+
+# sections whose charts can show another drug type: the dataset the drug is
+# filtered from, its drug column, and the frames that take the drug
+DRUG_SECTIONS = {
+    'oos_rx':('oos', 'drug type', ('benzo_oos', 'andro_oos')),
+}
+
+
+class ReportServer:
+    """
+    keeps the report's datasets in memory and renders any section on request for a
+    span of years, a subset of counties or another drug type, reusing the builders
+    in `figures`
+
+    rendered figures are kept as plotly json in a bounded lru cache, keyed by the
+    section and the request's parameters
+    """
+    def __init__(self, client:tableau.TableauClient, reference:ReferenceData, years:range, cache_size:int=128, max_workers:int=8):
+        """
+        args:
+            client: the `TableauClient` datasets are read (or pulled) with, offline
+                to serve only what is cached
+            reference: the `ReferenceData` cache for the geojson and populations
+            years: the years loaded, requests can ask for any span of them
+            cache_size: rendered sections kept in memory
+            max_workers: the most downloads at one time while loading
+        """
+        self.client = client
+        self.years = years
+        data = yearly_figures.fetch_all(client, reference, years, max_workers=max_workers, mutable_years=set())
+        lazy = {key:value for key, value in data.items() if isinstance(value, pl.LazyFrame)}
+        # collected once, every request is a query over these in memory
+        self.data = {**data, **{key:frame.lazy() for key, frame in zip(lazy, pl.collect_all(list(lazy.values())))}}
+        self.counties = set(self.data['rx_pat_county'].select('county').unique().collect()['county'])
+        # the county geometry, sent once to a page rather than in every map trace
+        self.geojson = json.dumps(self.data.get('counties'), separators=(',', ':')).encode()
+        self.charts = {chart:name for name, section in sections.SECTIONS.items() for chart in section.outputs}
+        self._variants:dict[tuple[str, str], pl.LazyFrame] = {}
+        self._variants_lock = threading.Lock()
+        self._render = functools.lru_cache(maxsize=cache_size)(self._render_section)
+
+    def _variant(self, key:str, column:str, drug:str) -> pl.LazyFrame:
+        # a dataset for a drug outside its `where`, pulled once (or read from the
+        # extract cache) with the drug as its view filter
+        with self._variants_lock:
+            if (key, drug) not in self._variants:
+                dataset = dataclasses.replace(DATASETS[key], where={**DATASETS[key].where, column:[drug]})
+                luid = tableau.find_view_luid(view_name=dataset.view, workbook_name=yearly_figures.WORKBOOK, client=self.client)
+                pulled = tableau.lazyframe_from_view_years(luid, self.years, filters=dataset.view_filters(), schema=dataset.schema, client=self.client)
+                self._variants[key, drug] = dataset.project(pulled).collect().lazy()
+            return self._variants[key, drug]
+
+    def _render_section(self, name:str, start:int, end:int, counties:tuple[str, ...], drug:str|None) -> dict[str, bytes]:
+        import plotly.io as pio
+        start_time = time.perf_counter()
+        section = sections.SECTIONS[name]
+        frame_names, _ = yearly_figures.plan([name])
+        data = dict(self.data)
+        if counties:
+            data['rx_pat_county'] = data['rx_pat_county'].filter(pl.col('county').is_in(counties))
+        drugs = None
+        if drug is not None:
+            key, column, drug_frames = DRUG_SECTIONS[name]
+            if drug not in DATASETS[key].where.get(column, []):
+                data[key] = self._variant(key, column, drug)
+            drugs = {frame:drug for frame in drug_frames}
+        frames = yearly_figures.collect_frames(yearly_figures.derive(yearly_figures.window(data, range(start, end + 1)), frame_names, drugs))
+        inputs = {**frames, 'counties':self.data.get('counties')}
+        figures = section.builder()(*[inputs[key] for key in section.inputs], None)
+        rendered = {}
+        for chart, fig in figures.items():
+            if isinstance(fig, dict) and inputs['counties'] is not None:
+                for trace in fig['data']:
+                    if trace.get('geojson') is inputs['counties']:
+                        trace['geojson'] = geometry.SHARED_GEOJSON
+            # only None when writing to a file
+            figure = pio.to_json(fig, validate=False)
+            assert figure is not None
+            rendered[chart] = figure.encode()
+        print(f'rendered {name} for {start}-{end}{", " + ", ".join(counties) if counties else ""}{", " + drug if drug else ""} in {time.perf_counter() - start_time:.2f}s')
+        return rendered
+
+    def figure_json(self, chart:str, query:dict[str, list[str]]) -> bytes:
+        """
+        args:
+            chart: a chart file name, eg 'benzo_oos.html'
+            query: parsed query parameters, any of `years` (eg '2020-2024'),
+                `county` (comma separated county names, for `county_data`) and
+                `drug` (a drug type, for the sections in `DRUG_SECTIONS`)
+
+        returns:
+            the figure as plotly json, traces drawing the county geometry have
+            `geojson=geometry.SHARED_GEOJSON` in place of it, the page fills it in
+            from `/geojson`
+        """
+        if chart not in self.charts:
+            raise KeyError(chart)
+        name = self.charts[chart]
+        years = yearly_figures.parse_years(query['years'][0]) if 'years' in query else list(self.years)
+        if years[0] < self.years[0] or years[-1] > self.years[-1] or len(years) < 2:
+            raise ValueError(f'years must be at least two years within {self.years[0]}-{self.years[-1]}')
+        counties = tuple(sorted({county.strip().upper() for value in query.get('county', []) for county in value.split(',') if county.strip()}))
+        if counties and name != 'county_data':
+            raise ValueError('county only applies to the county_data charts')
+        if unknown := set(counties) - self.counties:
+            raise ValueError(f'unknown counties: {", ".join(sorted(unknown))}')
+        drug = query['drug'][0] if 'drug' in query else None
+        if drug is not None and name not in DRUG_SECTIONS:
+            raise ValueError(f'drug only applies to the {", ".join(DRUG_SECTIONS)} charts')
+        if drug is not None and drug not in DRUG_TYPES:
+            raise ValueError(f'drug must be one of {", ".join(DRUG_TYPES)}')
+        return self._render(name, years[0], years[-1], counties, drug)[chart]
+
+    def index(self) -> str:
+        links = ''.join(f'<li><a href="/chart/{chart}">{chart}</a> ({name})</li>' for chart, name in self.charts.items())
+        return (
+            '<!doctype html><html><body><h1>report charts</h1>'
+            f'<p>query parameters: <code>years</code> (eg {self.years[1]}-{self.years[-1]}), <code>county</code> '
+            f'(eg PIMA,MARICOPA, county_data only), <code>drug</code> ({", ".join(DRUG_TYPES)}, {", ".join(DRUG_SECTIONS)} only)</p>'
+            f'<ul>{links}</ul></body></html>'
+        )
+
+    def page(self, chart:str, query:str) -> str:
+        import plotly.offline
+
+        def script_json(value:Any) -> str:
+            # a '</script>' in the query would otherwise end the script block
+            return json.dumps(value).replace('</', '<\\/')
+
+        source = f'/figure/{chart}?{query}'
+        return (
+            f'<!doctype html><html><head><meta charset="utf-8"><title>{html.escape(chart)}</title>'
+            f'<script src="https://cdn.plot.ly/plotly-{plotly.offline.get_plotlyjs_version()}.min.js"></script></head>'
+            '<body><div id="chart" style="height:95vh"></div><script>'
+            f'fetch({script_json(source)}).then(r => r.ok ? r.json() : r.text().then(t => Promise.reject(t)))'
+            f'.then(fig => {{ const shared = fig.data.filter(t => t.geojson === {script_json(geometry.SHARED_GEOJSON)});'
+            ' return shared.length ? fetch("/geojson").then(r => r.json()).then(g => { shared.forEach(t => t.geojson = g); return fig; }) : fig; })'
+            '.then(fig => Plotly.newPlot("chart", fig))'
+            '.catch(e => document.getElementById("chart").textContent = e);'
+            '</script></body></html>'
+        )
+
+    def handler(self) -> type[BaseHTTPRequestHandler]:
+        report = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format:str, *args:Any) -> None:
+                pass
+
+            def send(self, body:bytes|str, content_type:str='text/html; charset=utf-8', status:int=200) -> None:
+                body = body.encode() if isinstance(body, str) else body
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                url = urllib.parse.urlparse(self.path)
+                try:
+                    if url.path == '/':
+                        return self.send(report.index())
+                    if url.path == '/stats':
+                        return self.send(json.dumps(report._render.cache_info()._asdict()), 'application/json')
+                    if url.path == '/geojson':
+                        return self.send(report.geojson, 'application/json')
+                    if url.path.startswith('/chart/'):
+                        return self.send(report.page(url.path.removeprefix('/chart/'), url.query))
+                    if url.path.startswith('/figure/'):
+                        return self.send(report.figure_json(url.path.removeprefix('/figure/'), urllib.parse.parse_qs(url.query)), 'application/json')
+                    self.send('not found', 'text/plain', 404)
+                except KeyError as e:
+                    self.send(f'unknown chart {e}', 'text/plain', 404)
+                except tableau.OfflineError:
+                    self.send('that data isn\'t cached, start the server with --online to pull it', 'text/plain', 503)
+                except ValueError as e:
+                    self.send(str(e), 'text/plain', 400)
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description='serve the report charts, rendered on request from the cached data')
+    parser.add_argument('--years', type=yearly_figures.parse_years, default=list(yearly_figures.report_window(yearly_figures.YEAR)), help='years to load, eg 2019-2024, defaults to the current report\'s')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--cache-size', type=int, default=128, help='rendered sections kept in memory')
+    parser.add_argument('--online', action='store_true', help='pull from tableau what isn\'t cached, eg another drug type, otherwise only cached data is served')
+    args = parser.parse_args()
+
+    years = range(args.years[0], args.years[-1] + 1)
+    reference = ReferenceData(offline=not args.online)
+    client = tableau.TableauClient(extract_cache=ExtractCache(), offline=not args.online)
+    report = ReportServer(client, reference, years, args.cache_size)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), report.handler())
+    print(f'serving the {years[0]}-{years[-1]} report on http://127.0.0.1:{args.port}/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        client.sign_out()
+
+if __name__ == '__main__':
+    main()
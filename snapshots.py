@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any
+
+import polars as pl
+
+from files import sha256, write_json
+from telemetry import span
+
+ROOT = 'snapshots'
+
+
+def _manifest_path(year:int, root:str) -> str:
+    return os.path.join(root, str(year), 'manifest.json')
+
+def manifest(year:int, root:str=ROOT) -> dict[str, Any]:
+    """
+    args:
+        year: the report year
+        root: the snapshot directory
+
+    returns:
+        the year's manifest, `datasets` maps each dataset name to its latest
+        `version`, `file`, `digest` (of the contents), `sha256` (of the file),
+        `rows`, `bytes`, `schema` and `published_at`,
+        plus `versions`, the entries of the versions still on disk, oldest first
+    """
+    try:
+        with open(_manifest_path(year, root)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'year':year, 'datasets':{}}
+
+def _digest(frame:pl.DataFrame) -> str:
+    # of the contents, the ipc bytes of equal frames can differ with their chunking
+    digest = hashlib.sha256(f'{pl.__version__} {frame.schema}'.encode())
+    digest.update(frame.hash_rows(seed=0).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def publish(frames:dict[str, pl.DataFrame], year:int, root:str=ROOT, keep:int=5) -> str:
+    """
+    writes each frame as an uncompressed arrow ipc (feather v2) file, so readers
+    can memory map it without copying, and records it in the year's manifest
+
+    a frame identical to its dataset's latest version is not written again, a
+    changed one becomes a new version next to the old ones, files are never
+    rewritten in place so a reader mapping one is never cut off mid read
+
+    args:
+        frames: dict of dataset name to DataFrame, eg the frames from `derive()`
+        year: the report year
+        root: the snapshot directory
+        keep: versions of each dataset kept on disk, older ones are removed
+
+    returns:
+        path of the manifest
+    """
+    current = manifest(year, root)
+    for name, frame in frames.items():
+        directory = os.path.join(root, str(year), name)
+        os.makedirs(directory, exist_ok=True)
+        entry = current['datasets'].get(name, {})
+        with span('snapshot.publish', dataset=name, year=year) as publishing:
+            digest = _digest(frame)
+            if digest == entry.get('digest') and os.path.exists(os.path.join(root, str(year), entry['file'])):
+                continue
+            version = entry.get('version', 0) + 1
+            file = os.path.join(name, f'v{version}.arrow')
+            tmp_path = os.path.join(root, str(year), f'{file}.tmp')
+            frame.write_ipc(tmp_path, compression='uncompressed')
+            file_hash = sha256(tmp_path)
+            os.replace(tmp_path, os.path.join(root, str(year), file))
+            publishing.rows = frame.height
+            publishing.bytes_written = os.path.getsize(os.path.join(root, str(year), file))
+
+        latest = {
+            'version':version,
+            'file':file,
+            'digest':digest,
+            'sha256':file_hash,
+            'rows':frame.height,
+            'bytes':publishing.bytes_written,
+            'schema':{col:str(dtype) for col, dtype in frame.schema.items()},
+            'published_at':time.time(),
+        }
+        versions = [*entry.get('versions', []), {k:v for k, v in latest.items() if k != 'schema'}]
+        for old in versions[:-keep]:
+            try:
+                os.remove(os.path.join(root, str(year), old['file']))
+            except FileNotFoundError:
+                pass
+        current['datasets'][name] = {**latest, 'versions':versions[-keep:]}
+        print(f'published {name} v{version} for {year}: {frame.height:,} rows')
+
+    manifest_path = _manifest_path(year, root)
+    write_json(manifest_path, current)
+    return manifest_path
+
+def _entry(name:str, year:int, root:str, version:int|None) -> dict[str, Any]:
+    datasets = manifest(year, root)['datasets']
+    if name not in datasets:
+        raise KeyError(f'no snapshot of {name!r} for {year}, published: {", ".join(datasets) or "none"}')
+    if version is None:
+        return datasets[name]
+    for entry in datasets[name]['versions']:
+        if entry['version'] == version:
+            return entry
+    raise KeyError(f'{name!r} v{version} for {year} is not on disk, kept: {", ".join(str(entry["version"]) for entry in datasets[name]["versions"])}')
+
+def path(name:str, year:int, version:int|None=None, root:str=ROOT) -> str:
+    """
+    args:
+        name: dataset name, eg 'pat_county_rates'
+        year: the report year
+        version: optional version, defaults to the latest
+        root: the snapshot directory
+
+    returns:
+        path of the arrow ipc file, readable by anything that reads arrow ipc or
+        feather v2 (pyarrow, r arrow, duckdb)
+    """
+    return os.path.join(root, str(year), _entry(name, year, root, version)['file'])
+
+def load(name:str, year:int, version:int|None=None, root:str=ROOT, verify:bool=False) -> pl.DataFrame:
+    """
+    memory maps a published dataset, the DataFrame's buffers are the file's pages
+    so loading is near free and nothing is copied until it is modified
+
+    args:
+        name: dataset name, eg 'pat_county_rates'
+        year: the report year
+        version: optional version, defaults to the latest
+        root: the snapshot directory
+        verify: if True, check the file against the manifest's sha256 first, which
+            reads the whole file
+
+    returns:
+        the dataset as a DataFrame
+    """
+    entry = _entry(name, year, root, version)
+    file_path = os.path.join(root, str(year), entry['file'])
+    if verify and sha256(file_path) != entry['sha256']:
+        raise ValueError(f'{file_path} does not match its manifest checksum')
+    return pl.read_ipc(file_path)
+
+def scan(name:str, year:int, version:int|None=None, root:str=ROOT) -> pl.LazyFrame:
+    """
+    like `load()` but lazy, so only the columns and rows a query needs are read
+
+    returns:
+        a LazyFrame over the dataset
+    """
+    return pl.scan_ipc(path(name, year, version, root))
@@ -1,77 +1,631 @@
+import atexit
+import itertools
 import os
-from io import BytesIO
-from typing import Any
+import shutil
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import closing
+from typing import TYPE_CHECKING, Any, Self, TypeVar
 
 import polars as pl
 from dotenv import load_dotenv
-from tableauserverclient.models.tableau_auth import PersonalAccessTokenAuth
-from tableauserverclient.server.pager import Pager
-from tableauserverclient.server.request_options import CSVRequestOptions
-from tableauserverclient.server.server import Server
 
+from extract_cache import ExtractCache
+from files import read_json, write_json
+from telemetry import Span, span
 
-def lazyframe_from_view_id(view_id:str, filters:dict|None=None, **kwargs:Any) -> pl.LazyFrame:
+# tableauserverclient (and requests with it) is imported where it's used, so runs
+# served from the cache don't pay for importing it
+if TYPE_CHECKING:
+    import requests
+    from tableauserverclient.server.request_options import CSVRequestOptions
+    from tableauserverclient.server.server import Server
+
+
+T = TypeVar('T')
+ViewSchema = dict[str, tuple[str, pl.DataType]]
+
+
+class OfflineError(RuntimeError):
+    """
+    raised when a tableau request is needed but the client is offline
+    """
+
+
+def _retryable(e:Exception) -> bool:
+    import requests
+    from tableauserverclient.server.endpoint.exceptions import (
+        InternalServerError,
+        ServerResponseError,
+    )
+
+    # server errors and throttling, not bad requests, missing views or auth,
+    # tableauserverclient raises any 5xx as InternalServerError
+    if isinstance(e, InternalServerError):
+        return True
+    if isinstance(e, ServerResponseError):
+        return str(e.code).startswith(('5', '429'))
+    return isinstance(e, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError))
+
+
+class TableauClient:
+    """
+    a tableau session that signs in once and is shared for a whole run
+
+    the underlying `Server` keeps its requests session (and connection pool) for
+    the life of the client, and the auth token is refreshed when it is older than
+    `token_ttl` or when the server rejects it as expired
+
+    view luids are resolved through a per workbook name -> luid index that is built
+    once per run and kept in `cache_dir` for `index_ttl` seconds
+
+    sign in (and creating the `Server`, which asks the server for its version) is
+    deferred until the first request, so a run served entirely from the view index
+    and `extract_cache` never contacts the server
+
+    csv exports are streamed to files in a spool directory that is removed when the
+    interpreter exits, and each download is recorded in `downloads`, a download
+    that fails with a server error, a throttle or a dropped connection is tried
+    again `retries` times with exponential backoff
+
+    a client can be shared between threads, sign in and index builds are serialized
+    while view lookups and exports run concurrently over the same connection pool,
+    at most `max_downloads` exports at a time however many threads ask for them
+
+    use as a context manager:
+
+        with TableauClient() as client:
+            luid = find_view_luid('Bup Dispensed', 'annual report', client=client)
+            lf = lazyframe_from_view_id(luid, client=client)
+    """
+    def __init__(
+        self,
+        token_ttl:float=3600.0,
+        cache_dir:str='.cache/tableau',
+        index_ttl:float=86400.0,
+        extract_cache:ExtractCache|None=None,
+        refresh:bool=False,
+        offline:bool=False,
+        retries:int=3,
+        backoff:float=2.0,
+        max_downloads:int=8
+    ):
+        """
+        args:
+            token_ttl: seconds after sign in before the token is proactively refreshed,
+                tableau personal access token sessions last 240 minutes by default
+            cache_dir: directory for the on disk view index
+            index_ttl: seconds before a view index on disk is considered stale
+            extract_cache: optional parquet cache for view extracts
+            refresh: if True, ignore cached extracts and pull them again
+            offline: if True, never contact the server, cached extracts and view
+                indexes are used regardless of age and a miss raises `OfflineError`
+            retries: times a failed csv export is tried again
+            backoff: seconds before the first retry, doubled for each one after
+            max_downloads: the most csv exports in flight at one time across every
+                thread using the client, the connection pool is sized to match
+        """
+        if refresh and offline:
+            raise ValueError('refresh and offline are mutually exclusive')
+        if retries < 0:
+            raise ValueError(f'retries must be 0 or more, got {retries}')
+        if max_downloads < 1:
+            raise ValueError(f'max_downloads must be 1 or more, got {max_downloads}')
+
+        load_dotenv()
+
+        server = os.environ.get('TABLEAU_SERVER', 'TABLEAU_SERVER missing from .env file')
+        site = os.environ.get('TABLEAU_SITE', 'TABLEAU_SITE missing from .env file')
+        token_name = os.environ.get('TABLEAU_TOKEN_NAME', 'TABLEAU_TOKEN_NAME missing from .env file')
+        token_value = os.environ.get('TABLEAU_TOKEN_VALUE', 'TABLEAU_TOKEN_VALUE missing from .env file')
+
+        self._credentials = (server, site, token_name, token_value)
+        self._server:Server|None = None
+        self.token_ttl = token_ttl
+        self.sign_ins = 0
+        self._signed_in_at:float|None = None
+        self.cache_dir = cache_dir
+        self.index_ttl = index_ttl
+        self._view_indexes:dict[str, dict[str, str]] = {}
+        self.extract_cache = extract_cache
+        self.refresh = refresh
+        self.offline = offline
+        self.retries = retries
+        self.backoff = backoff
+        self.max_downloads = max_downloads
+        self._download_slots = threading.BoundedSemaphore(max_downloads)
+        self.downloads:list[dict[str, Any]] = []
+        self._spool_dir:str|None = None
+        self._auth_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._server_lock = threading.Lock()
+
+    @property
+    def server(self) -> 'Server':
+        """
+        the tableauserverclient `Server`, created on first use
+        """
+        with self._server_lock:
+            if self._server is None:
+                from tableauserverclient.models.tableau_auth import (
+                    PersonalAccessTokenAuth,
+                )
+                from tableauserverclient.server.server import Server
+
+                url, site, token_name, token_value = self._credentials
+                self.tableau_auth = PersonalAccessTokenAuth(token_name, token_value, site)
+                self._server = Server(url, use_server_version=True, http_options={'verify':False}, session_factory=self._session)
+            return self._server
+
+    def _session(self) -> 'requests.Session':
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # requests keeps 10 connections per host by default, one per export in flight
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max(10, self.max_downloads))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc:object) -> None:
+        self.sign_out()
+
+    def sign_in(self) -> None:
+        """
+        signs in (or signs in again) without replacing the server's http session
+        """
+        server = self.server
+        with span('tableau.sign_in'):
+            server.auth.sign_in(self.tableau_auth)
+        self._signed_in_at = time.monotonic()
+        self.sign_ins += 1
+
+    def sign_out(self) -> None:
+        if self._server is not None and self._server.is_signed_in():
+            self._server.auth.sign_out()
+        self._signed_in_at = None
+
+    def _token_expired(self) -> bool:
+        return self._signed_in_at is None or time.monotonic() - self._signed_in_at > self.token_ttl
+
+    def call(self, fn:Callable[['Server'], T]) -> T:
+        """
+        runs `fn` against the signed in server, signing in again once if the token
+        has expired or the server answers with a 401
+
+        args:
+            fn: a callable taking the `Server` and returning a result
+
+        returns:
+            the result of `fn`
+        """
+        if self.offline:
+            raise OfflineError('tableau request needed but the client is offline, run once without --offline to fill the cache')
+        from tableauserverclient.server.endpoint.exceptions import XMLError
+
+        with self._auth_lock:
+            if self._token_expired():
+                self.sign_in()
+            signed_in_at = self._signed_in_at
+        try:
+            return fn(self.server)
+        except XMLError as e:
+            # tableauserverclient raises a 401 as FailedSignInError, which isn't a
+            # ServerResponseError
+            if not str(e.code).startswith('401'):
+                raise
+            with self._auth_lock:
+                # another thread may have already signed in again after the same 401
+                if self._signed_in_at == signed_in_at:
+                    self.sign_in()
+            return fn(self.server)
+
+    @property
+    def spool_dir(self) -> str:
+        """
+        a temporary directory for streamed csv exports, created on first use
+        """
+        with self._auth_lock:
+            if self._spool_dir is None:
+                self._spool_dir = tempfile.mkdtemp(prefix='tableau-')
+                atexit.register(shutil.rmtree, self._spool_dir, ignore_errors=True)
+            return self._spool_dir
+
+    def download_csv(self, view_id:str, options:'CSVRequestOptions|None'=None) -> str:
+        """
+        streams the csv export of a view to a spool file chunk by chunk, so memory
+        use does not grow with the size of the export
+
+        args:
+            view_id: luid of the view
+            options: optional csv request options (view filters)
+
+        returns:
+            path of the csv file
+        """
+        import requests
+        from tableauserverclient.server.endpoint.exceptions import (
+            InternalServerError,
+            ServerResponseError,
+        )
+
+        def fetch(server:'Server') -> tuple[str, int, float]:
+            start = time.perf_counter()
+            # not `populate_csv`, tableauserverclient reads the whole body of a text
+            # response into memory to log it before the first chunk is handed over
+            url = f'{server.views.baseurl}/{view_id}/data'
+            response = server.session.get(
+                url,
+                params=options.get_query_params() if options is not None else None,
+                headers={'x-tableau-auth':server.auth_token},
+                stream=True,
+                **server.http_options
+            )
+            with closing(response):
+                # raised as tableauserverclient would, error bodies are small, a 401
+                # comes back as a ServerResponseError for `call()` to sign in again
+                if response.status_code >= 500 or response.status_code == 429:
+                    raise InternalServerError(response, url)
+                if response.status_code != 200:
+                    raise ServerResponseError.from_response(response.content, server.namespace, url)
+                fd, path = tempfile.mkstemp(suffix='.csv', dir=self.spool_dir)
+                size = 0
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        for chunk in response.iter_content(1 << 20):
+                            f.write(chunk)
+                            size += len(chunk)
+                except BaseException:
+                    os.remove(path)
+                    raise
+            return path, size, time.perf_counter() - start
+
+        with span('tableau.download', view_id=view_id) as download:
+            attempt = 0
+            while True:
+                try:
+                    with self._download_slots:
+                        path, size, seconds = self.call(fetch)
+                except (ServerResponseError, InternalServerError, requests.RequestException) as e:
+                    if attempt == self.retries or not _retryable(e):
+                        raise
+                    delay = self.backoff * 2 ** attempt
+                    print(f'export of {view_id} failed, retrying in {delay:.0f}s: {" ".join(str(e).split())}')
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                view_name = self._view_name(view_id)
+                download.bytes_downloaded = size
+                download.attrs.update(view=view_name, attempts=attempt + 1)
+                self.downloads.append({'view_id':view_id, 'view':view_name, 'bytes':size, 'seconds':seconds})
+                print(f'downloaded {view_name}: {size / 1e6:.2f} MB in {seconds:.2f}s ({size / 1e6 / max(seconds, 1e-9):.2f} MB/s)')
+                return path
+
+    def _view_name(self, view_id:str) -> str:
+        # from the view indexes already loaded, the luid when the view was never looked up
+        with self._index_lock:
+            for views in self._view_indexes.values():
+                for name, luid in views.items():
+                    if luid == view_id:
+                        return name
+        return view_id
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.cache_dir, 'view_index.json')
+
+    def _read_index_file(self) -> dict:
+        return read_json(self._index_path)
+
+    def _write_index_file(self, workbook_name:str, views:dict[str, str]) -> None:
+        indexes = self._read_index_file()
+        indexes[workbook_name] = {'built_at':time.time(), 'views':views}
+        write_json(self._index_path, indexes)
+
+    def view_index(self, workbook_name:str, refresh:bool=False) -> dict[str, str]:
+        """
+        gets the view name -> luid index for `workbook_name`, from memory, then from
+        the on disk cache if younger than `index_ttl`, then from the server
+
+        args:
+            workbook_name: string name of the workbook to index
+            refresh: if True, ignore memory and disk and rebuild from the server
+
+        returns:
+            a dict of view name to view luid for every view in the workbook
+        """
+        with self._index_lock:
+            return self._view_index(workbook_name, refresh)
+
+    def _view_index(self, workbook_name:str, refresh:bool) -> dict[str, str]:
+        if not refresh:
+            if workbook_name in self._view_indexes:
+                return self._view_indexes[workbook_name]
+            cached = self._read_index_file().get(workbook_name)
+            if cached and (self.offline or time.time() - cached['built_at'] < self.index_ttl):
+                self._view_indexes[workbook_name] = cached['views']
+                return cached['views']
+
+        def build(server:'Server') -> dict[str, str]:
+            from tableauserverclient.server.filter import Filter
+            from tableauserverclient.server.pager import Pager
+            from tableauserverclient.server.request_options import RequestOptions
+
+            options = RequestOptions()
+            options.filter.add(Filter(RequestOptions.Field.Name, RequestOptions.Operator.Equals, workbook_name))
+            workbooks = list(Pager(server.workbooks, options))
+            if not workbooks:
+                raise KeyError(f'workbook {workbook_name!r} not found')
+            server.workbooks.populate_views(workbooks[0])
+            return {view.name:view.id for view in workbooks[0].views if view.name and view.id}
+
+        with span('tableau.view_index', workbook=workbook_name):
+            views = self.call(build)
+        self._view_indexes[workbook_name] = views
+        self._write_index_file(workbook_name, views)
+        return views
+
+
+def _typed_column(name:str, dtype:pl.DataType) -> pl.Expr:
+    column = pl.col(name)
+    if dtype.is_numeric():
+        # tableau exports numbers with thousands separators
+        return column.str.replace_all(',', '', literal=True).cast(dtype)
+    if dtype == pl.Boolean:
+        return column.str.to_lowercase() == 'true'
+    return column.cast(dtype)
+
+def scan_typed_csv(path:str, schema:ViewSchema|None=None, **kwargs:Any) -> pl.LazyFrame:
+    """
+    scans a tableau csv export, typing and renaming the columns in `schema`
+
+    with a schema every column is read as text, so nothing depends on inference,
+    numeric columns have their thousands separators stripped and are cast in one
+    pass, and columns not in the schema are dropped
+
+    args:
+        path: path of the csv file
+        schema: optional dict of source column name to (new name, dtype)
+        kwargs: optional kwargs to pass to polars `scan_csv()`
+
+    returns:
+        a LazyFrame over the csv
+    """
+    if schema is None:
+        return pl.scan_csv(path, **kwargs)
+    return (
+        pl.scan_csv(path, infer_schema=False, **kwargs)
+        .select(_typed_column(source, dtype).alias(name) for source, (name, dtype) in schema.items())
+    )
+
+def _vf_value(value:Any) -> str:
+    # tableau takes several values for one filter comma separated, commas inside
+    # a value are escaped
+    if isinstance(value, (list, tuple)):
+        return ','.join(str(v).replace(',', '\\,') for v in value)
+    return str(value)
+
+def view_filter_options(filters:dict[str, Any]|None) -> 'CSVRequestOptions|None':
     """
-    pulls a lazyframe from the specified view in tableau    
+    builds csv request options from a dict of view filters
+
+    args:
+        filters: dict of tableau field name to a value, or a list of values to
+            keep any of
+
+    returns:
+        the CSVRequestOptions, or None if there are no filters
+    """
+    if not filters:
+        return None
+    from tableauserverclient.server.request_options import CSVRequestOptions
+
+    options = CSVRequestOptions()
+    for k,v in filters.items():
+        options.vf(k, _vf_value(v))
+    return options
+
+def _record_parquet(stage:Span, path:str) -> None:
+    stage.bytes_written = os.path.getsize(path)
+    # from the parquet footer, the file isn't read
+    stage.rows = pl.scan_parquet(path).select(pl.len()).collect().item()
+
+def _read_key(schema:ViewSchema|None, kwargs:dict[str, Any]) -> dict[str, Any]:
+    if schema is None:
+        return kwargs
+    return {'schema':{source:[name, str(dtype)] for source, (name, dtype) in schema.items()}, **kwargs}
+
+def _pull_chunks(
+    client:TableauClient,
+    view_id:str,
+    chunks:list[tuple[dict[str, Any], dict[str, Any], bool]],
+    filters:dict|None,
+    schema:ViewSchema|None,
+    max_age:float|None,
+    max_workers:int,
+    **kwargs:Any
+) -> list[pl.LazyFrame]:
+    """
+    pulls the chunks of a partitioned export concurrently, each with its own view
+    filters, keeping finished chunks in the extract cache so a failed export
+    resumes from the chunks already written
+
+    args:
+        client: the `TableauClient` to download with
+        view_id: luid of the view
+        chunks: a list of (partition, chunk filters, reusable), where partition
+            names the chunk on disk, chunk filters are sent on top of `filters`,
+            and only reusable chunks are read from the cache
+        filters: view filters sent with every chunk
+        schema: optional dict of source column name to (new name, dtype)
+        max_age: seconds a cached chunk stays reusable, None for no limit
+        max_workers: the most chunks downloading at one time
+        kwargs: optional kwargs to pass to polars `scan_csv()`
+
+    returns:
+        a LazyFrame per chunk, in the order of `chunks`
+    """
+    cache = client.extract_cache
+    read_key = _read_key(schema, kwargs)
+
+    def pull(partition:dict[str, Any], chunk_filters:dict[str, Any], reusable:bool) -> pl.LazyFrame:
+        if cache is not None and reusable:
+            path = cache.get_partition(view_id, filters, read_key, partition, max_age)
+            if path is not None:
+                return pl.scan_parquet(path)
+        csv_path = client.download_csv(view_id, view_filter_options({**(filters or {}), **chunk_filters}))
+        lf = scan_typed_csv(csv_path, schema, **kwargs)
+        if cache is None:
+            return lf
+        with span('tableau.write_extract', view_id=view_id, **partition) as write:
+            path = cache.put_partition(view_id, filters, read_key, partition, lf)
+            _record_parquet(write, path)
+        os.remove(csv_path)
+        return pl.scan_parquet(path)
+
+    # every chunk is waited for before a failure is raised, so all the chunks that
+    # could be pulled are on disk for the next run
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(pull, *chunk) for chunk in chunks]
+        wait(futures)
+    return [future.result() for future in futures]
+
+def lazyframe_from_view_id(
+    view_id:str,
+    filters:dict|None=None,
+    schema:ViewSchema|None=None,
+    partition_by:dict[str, list]|None=None,
+    max_workers:int=4,
+    client:TableauClient|None=None,
+    **kwargs:Any
+) -> pl.LazyFrame:
+    """
+    pulls a lazyframe from the specified view in tableau
 
     args:
         view_id: a string, luid of the target view, can be found with `find_luid()`
-        filters: optional filters to apply before pulling the lazyframe
+        filters: optional view filters to apply before pulling the lazyframe, a
+            list value keeps rows matching any of its values
+        schema: optional dict of source column name to (new name, dtype), applied
+            when the csv is read, see `scan_typed_csv()`
+        partition_by: optional dict of view filter name to the values to split the
+            export on, eg {'drug type':DRUG_TYPES}, one chunk is exported per value
+            (per combination for several filters) instead of one csv for the view
+        max_workers: the most chunks downloading at one time with `partition_by`
+        client: optional signed in `TableauClient` to reuse, a temporary one is used if omitted
         kwargs:  optional kwargs to pass to polars `read_csv()`
 
     returns:
-        a LazyFrame containing the data from the specified view, filtered if 
-        filters are specified 
-    """
-    load_dotenv()
-
-    server = os.environ.get('TABLEAU_SERVER', 'TABLEAU_SERVER missing from .env file')
-    site = os.environ.get('TABLEAU_SITE', 'TABLEAU_SITE missing from .env file')
-    token_name = os.environ.get('TABLEAU_TOKEN_NAME', 'TABLEAU_TOKEN_NAME missing from .env file')
-    token_value = os.environ.get('TABLEAU_TOKEN_VALUE', 'TABLEAU_TOKEN_VALUE missing from .env file')
-
-    tableau_auth = PersonalAccessTokenAuth(token_name, token_value, site)
-    tableau_server = Server(server, use_server_version=True, http_options={'verify':False})
-
-    with tableau_server.auth.sign_in(tableau_auth):
-        if filters:
-            options = CSVRequestOptions()
-            for k,v in filters.items():
-                options.vf(k,v)
-        else:
-            options = None
-        view = tableau_server.views.get_by_id(view_id)
-        tableau_server.views.populate_csv(view, options)
-        buffer = BytesIO()
-        buffer.write(b''.join(view.csv))
-        buffer.seek(0)
-        return pl.scan_csv(buffer, **kwargs)
-
-def find_view_luid(view_name:str, workbook_name:str) -> str:
+        a LazyFrame containing the data from the specified view, filtered if
+        filters are specified, backed by parquet when the client has an extract cache
+    """
+    if client is None:
+        with TableauClient() as temp_client:
+            return lazyframe_from_view_id(view_id, filters, schema, partition_by, max_workers, client=temp_client, **kwargs)
+
+    cache = client.extract_cache
+    if partition_by:
+        chunks = [
+            (dict(zip(partition_by, values)), dict(zip(partition_by, values)), not client.refresh)
+            for values in itertools.product(*partition_by.values())
+        ]
+        max_age = None if client.offline or cache is None else cache.ttl
+        return pl.concat(_pull_chunks(client, view_id, chunks, filters, schema, max_age, max_workers, **kwargs), how='vertical_relaxed')
+
+    if cache is None:
+        return scan_typed_csv(client.download_csv(view_id, view_filter_options(filters)), schema, **kwargs)
+
+    key = cache.key(view_id, filters, _read_key(schema, kwargs))
+    if not client.refresh:
+        path = cache.get(key, ignore_ttl=client.offline)
+        if path is not None:
+            return pl.scan_parquet(path)
+
+    csv_path = client.download_csv(view_id, view_filter_options(filters))
+    lf = scan_typed_csv(csv_path, schema, **kwargs)
+    with span('tableau.write_extract', view_id=view_id) as write:
+        path = cache.put(key, lf, view_id=view_id, filters=filters)
+        _record_parquet(write, path)
+    os.remove(csv_path)
+    return pl.scan_parquet(path)
+
+def lazyframe_from_view_years(
+    view_id:str,
+    years:range|list[int],
+    mutable_years:set[int]|None=None,
+    year_filters:tuple[str, str]=('start_year', 'end_year'),
+    filters:dict|None=None,
+    schema:ViewSchema|None=None,
+    max_workers:int=4,
+    client:TableauClient|None=None,
+    **kwargs:Any
+) -> pl.LazyFrame:
+    """
+    pulls a view one year at a time into a year partitioned parquet dataset, only
+    calling tableau for years that have not been pulled before or are mutable
+
+    args:
+        view_id: a string, luid of the target view
+        years: the years to return
+        mutable_years: years whose data can still change and are pulled every run,
+            usually just the current year
+        year_filters: names of the view filters for the first and last year
+        filters: optional view filters besides the years, sent with every pull,
+            a list value keeps rows matching any of its values
+        schema: optional dict of source column name to (new name, dtype), applied
+            before a partition is written, see `scan_typed_csv()`
+        max_workers: the most years downloading at one time
+        client: optional signed in `TableauClient` to reuse, a temporary one is used if omitted
+        kwargs:  optional kwargs to pass to polars `read_csv()`
+
+    returns:
+        a LazyFrame over the partitions for `years`, or over one pull of the whole
+        window when the client has no extract cache
+    """
+    if client is None:
+        with TableauClient() as temp_client:
+            return lazyframe_from_view_years(view_id, years, mutable_years, year_filters, filters, schema, max_workers, client=temp_client, **kwargs)
+
+    start_filter, end_filter = year_filters
+    if client.extract_cache is None:
+        return lazyframe_from_view_id(view_id, {**(filters or {}), start_filter:min(years), end_filter:max(years)}, schema, client=client, **kwargs)
+
+    mutable_years = mutable_years or set()
+    chunks = [
+        ({'year_filled':year}, {start_filter:year, end_filter:year}, not client.refresh and (year not in mutable_years or client.offline))
+        for year in years
+    ]
+    # without a schema a column can be inferred as a number in one year and as a
+    # string (thousands separators) in another, relaxed concat still lines them up
+    return pl.concat(_pull_chunks(client, view_id, chunks, filters, schema, None, max_workers, **kwargs), how='vertical_relaxed')
+
+def find_view_luid(view_name:str, workbook_name:str, client:TableauClient|None=None) -> str:
     """
     gets the luid from the `view_name` in `workbook_name`
 
     args:
         view_name: string name of the target view
         workbook_name: string name of the workbook the view is in
+        client: optional signed in `TableauClient` to reuse, a temporary one is used if omitted
 
     returns:
         string luid of the target view
     """
-    load_dotenv()
-
-    server = os.environ.get('TABLEAU_SERVER', 'TABLEAU_SERVER missing from .env file')
-    site = os.environ.get('TABLEAU_SITE', 'TABLEAU_SITE missing from .env file')
-    token_name = os.environ.get('TABLEAU_TOKEN_NAME', 'TABLEAU_TOKEN_NAME missing from .env file')
-    token_value = os.environ.get('TABLEAU_TOKEN_VALUE', 'TABLEAU_TOKEN_VALUE missing from .env file')
-
-    tableau_auth = PersonalAccessTokenAuth(token_name, token_value, site)
-    tableau_server = Server(server, use_server_version=True, http_options={'verify':False})
+    if client is None:
+        with TableauClient() as temp_client:
+            return find_view_luid(view_name, workbook_name, client=temp_client)
 
-    with tableau_server.auth.sign_in(tableau_auth):
-        all_workbooks = list(Pager(tableau_server.workbooks))
-        searched_workbook = [workbook for workbook in all_workbooks if workbook.name==workbook_name][0]
-        tableau_server.workbooks.populate_views(searched_workbook)
-        views = searched_workbook.views
-        searched_view = [view for view in views if view.name==view_name][0]
-        return searched_view.id
+    views = client.view_index(workbook_name)
+    if view_name not in views:
+        # the cached index may predate the view, rebuild it once before giving up
+        views = client.view_index(workbook_name, refresh=True)
+    if view_name not in views:
+        raise KeyError(f'view {view_name!r} not found in workbook {workbook_name!r}')
+    return views[view_name]
@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+try:
+    import resource
+except ImportError:   # windows
+    resource = None
+
+
+def _peak_rss() -> int:
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+@dataclass
+class Span:
+    """
+    one timed stage of a run
+
+    attributes:
+        name: stage name, eg 'tableau.download' or 'render.bup'
+        start: epoch seconds the stage started
+        seconds: wall time
+        peak_rss_delta: bytes the process's peak rss grew by during the stage,
+            concurrent stages in the same process share this
+        rows: rows produced, if the stage produces a frame
+        bytes_downloaded: bytes downloaded
+        bytes_written: bytes written to disk
+        attrs: anything else worth keeping, eg the view name
+        pid: process id
+        tid: thread id
+    """
+    name:str
+    start:float = 0.0
+    seconds:float = 0.0
+    peak_rss_delta:int = 0
+    rows:int = 0
+    bytes_downloaded:int = 0
+    bytes_written:int = 0
+    attrs:dict[str, Any] = field(default_factory=dict)
+    pid:int = 0
+    tid:int = 0
+
+
+class Tracer:
+    """
+    collects spans from every thread of a process, spans from worker processes are
+    sent back and added with `extend()`
+    """
+    def __init__(self):
+        self.spans:list[Span] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name:str, **attrs:Any) -> Iterator[Span]:
+        """
+        times the enclosed block, set `rows`, `bytes_downloaded` and `bytes_written`
+        on the yielded span as they become known
+
+        args:
+            name: stage name
+            attrs: extra attributes to record
+
+        yields:
+            the Span, added to `spans` when the block exits, even on error
+        """
+        span = Span(name, start=time.time(), attrs=attrs, pid=os.getpid(), tid=threading.get_ident())
+        rss = _peak_rss()
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.seconds = time.perf_counter() - start
+            span.peak_rss_delta = _peak_rss() - rss
+            with self._lock:
+                self.spans.append(span)
+
+    def mark(self) -> int:
+        """
+        returns:
+            a position in `spans`, for `since()`
+        """
+        with self._lock:
+            return len(self.spans)
+
+    def since(self, mark:int) -> list[Span]:
+        with self._lock:
+            return self.spans[mark:]
+
+    def extend(self, spans:list[Span]) -> None:
+        with self._lock:
+            self.spans.extend(spans)
+
+    def write_chrome_trace(self, path:str) -> None:
+        """
+        writes the spans as a chrome trace, viewable in chrome://tracing or perfetto
+
+        args:
+            path: output json path
+        """
+        events = [
+            {
+                'name':span.name,
+                'cat':span.name.split('.')[0],
+                'ph':'X',
+                'ts':span.start * 1e6,
+                'dur':span.seconds * 1e6,
+                'pid':span.pid,
+                'tid':span.tid,
+                'args':{
+                    **span.attrs,
+                    'peak_rss_delta':span.peak_rss_delta,
+                    'rows':span.rows,
+                    'bytes_downloaded':span.bytes_downloaded,
+                    'bytes_written':span.bytes_written,
+                },
+            }
+            for span in self.spans
+        ]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents':events, 'displayTimeUnit':'ms'}, f, default=str)
+
+    def summary(self) -> str:
+        """
+        returns:
+            a table of the spans grouped by name, in order of first start
+        """
+        groups:dict[str, list[Span]] = {}
+        for span in sorted(self.spans, key=lambda span: span.start):
+            groups.setdefault(span.name, []).append(span)
+        rows = [('stage', 'count', 'total s', 'max s', 'peak rss MB', 'rows', 'down MB', 'written MB')]
+        for name, spans in groups.items():
+            rows.append((
+                name,
+                str(len(spans)),
+                f'{sum(span.seconds for span in spans):.2f}',
+                f'{max(span.seconds for span in spans):.2f}',
+                f'{max(span.peak_rss_delta for span in spans) / 1e6:.1f}',
+                f'{sum(span.rows for span in spans):,}',
+                f'{sum(span.bytes_downloaded for span in spans) / 1e6:.2f}',
+                f'{sum(span.bytes_written for span in spans) / 1e6:.2f}',
+            ))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        return '\n'.join(
+            '  '.join(cell.ljust(width) if i == 0 else cell.rjust(width) for i, (cell, width) in enumerate(zip(row, widths)))
+            for row in rows
+        )
+
+
+tracer = Tracer()
+span = tracer.span
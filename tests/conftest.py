@@ -0,0 +1,69 @@
+import os
+import threading
+from collections.abc import Callable
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import pytest
+
+from bench import SITE, StandIn
+from reference import ReferenceData
+
+
+@pytest.fixture
+def stand_in(tmp_path, monkeypatch):
+    """
+    a tableau stand in with the client's credentials pointed at it, run from a
+    temporary directory so its exports and the caches stay out of the repo
+    """
+    monkeypatch.chdir(tmp_path)
+    server = StandIn(vertices=4)
+    monkeypatch.setenv('TABLEAU_SERVER', server.url)
+    monkeypatch.setenv('TABLEAU_SITE', SITE)
+    monkeypatch.setenv('TABLEAU_TOKEN_NAME', 'test')
+    monkeypatch.setenv('TABLEAU_TOKEN_VALUE', 'test')
+    yield server
+    server.close()
+
+@pytest.fixture
+def reference_server():
+    """
+    serves the bundled reference fixtures with Last-Modified validators, counting
+    the requests made and how many were answered 304
+    """
+    directory = os.path.join(os.path.dirname(__file__), 'fixtures', 'reference')
+    counts = {'requests':0, 'not_modified':0}
+
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *args:Any, **kwargs:Any):
+            super().__init__(*args, directory=directory, **kwargs)
+
+        def log_message(self, format:str, *args:Any) -> None:
+            pass
+
+        def send_response(self, code:int, message:str|None=None) -> None:
+            counts['requests'] += 1
+            counts['not_modified'] += code == 304
+            super().send_response(code, message)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}', counts
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def reference_data() -> Callable[..., ReferenceData]:
+    """
+    returns:
+        a function of (url, cache_dir, **kwargs) making a `ReferenceData` that
+        downloads from `url`, eg the `reference_server`'s
+    """
+    def make(url:str, cache_dir:str, **kwargs:Any) -> ReferenceData:
+        reference = ReferenceData(cache_dir=cache_dir, **kwargs)
+        reference.counties_url = f'{url}/counties.geojson'
+        reference.fips_url = f'{url}/fips.txt'
+        reference.acs_url = f'{url}/acs5_{{vintage}}.json'
+        return reference
+
+    return make
@@ -0,0 +1,64 @@
+import plotly.graph_objects as go
+import polars as pl
+import pytest
+
+import animation
+
+
+def figure() -> dict:
+    fig = go.Figure([
+        go.Scatter(name='a', x=[1, 2], y=[3, 4], mode='markers', marker={'color':'red', 'size':[5, 6]}),
+        go.Scatter(name='b', x=[1, 2], y=[7, 8], mode='lines'),
+    ]).to_dict()
+    fig['frames'] = [
+        {
+            'data':[
+                {**fig['data'][0], 'y':animation.column(pl.Series([3 + year, 4 + year])), 'marker':{**fig['data'][0]['marker'], 'size':animation.column(pl.Series([5, 6 + year]))}},
+                {**fig['data'][1], 'y':animation.column(pl.Series([7 + year, 8 + year]))},
+            ],
+            'name':str(year),
+        }
+        for year in (0, 1, 2)
+    ]
+    return fig
+
+def test_column():
+    assert animation.column(pl.Series(['a', 'b'])) == ['a', 'b']
+    assert animation.column(pl.Series([1.5, 2.5]))['dtype'] == 'f8'
+    assert animation.column(pl.DataFrame({'a':[1, 2], 'b':[3, 4]}))['shape'] == '2, 2'
+
+def test_delta_encode_keeps_only_changing_properties():
+    fig = animation.delta_encode(figure())
+    assert [frame['name'] for frame in fig['frames']] == ['0', '1', '2']
+    for frame in fig['frames']:
+        assert frame['traces'] == [0, 1]
+        a, b = frame['data']
+        assert set(a) == {'marker', 'type', 'y'} and set(a['marker']) == {'size'}
+        assert set(b) == {'type', 'y'}
+    # the static properties stay on the base traces
+    assert fig['data'][0]['marker']['color'] == 'red'
+    assert fig['data'][1]['mode'] == 'lines'
+
+def test_delta_encode_matches_traces_by_name():
+    fig = figure()
+    for frame in fig['frames']:
+        frame['data'].reverse()
+    fig = animation.delta_encode(fig)
+    assert all(frame['traces'] == [1, 0] for frame in fig['frames'])
+
+def test_delta_encode_rejects_traces_without_a_base():
+    fig = figure()
+    fig['frames'][1]['data'].append({**fig['data'][0], 'name':'c'})
+    with pytest.raises(ValueError, match="'c' has no base trace"):
+        animation.delta_encode(fig)
+
+def test_validate_frames_orders_like_plotly():
+    frames = [{'name':str(year), 'data':[{'y':[year], 'type':'scatter'}], 'traces':[0]} for year in (0, 1)]
+    validated = animation.validate_frames(frames)
+    expected = go.Frame(frames[0]).to_plotly_json()
+    assert [list(frame) for frame in validated] == [list(expected)] * 2
+    assert validated[1]['data'] == [{'type':'scatter', 'y':[1]}]
+
+def test_validate_frames_rejects_invalid_frames():
+    with pytest.raises(ValueError):
+        animation.validate_frames([{'name':'0', 'data':[{'type':'scatter', 'y':[0], 'marker':{'size':'big'}}]}])
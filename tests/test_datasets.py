@@ -0,0 +1,46 @@
+import polars as pl
+import pytest
+
+from datasets import Dataset
+from tableau import scan_typed_csv
+
+CSV = '''Year of Filled At,Prescription Count,obs,Quantity,Dropped
+2023,"1,204",opioid,"10,000.4",x
+2024,17,benzodiazepine,3.6,y
+2024,"2,001",androgen,12,z
+'''
+DATASET = Dataset(
+    view='OBS Dispensed',
+    schema={
+        'Year of Filled At':('year_filled', pl.Int64()),
+        'Prescription Count':('rx_count', pl.Int32()),
+        'obs':('drug', pl.String()),
+        'Quantity':('pills_count', pl.Float32()),
+    },
+    transforms=(pl.col('pills_count').round(0),),
+    filterable=('drug',),
+    where={'drug':['opioid', 'benzodiazepine'], 'year_filled':2024},
+)
+
+
+def test_schema_casts_and_renames(tmp_path):
+    path = tmp_path / 'view.csv'
+    path.write_text(CSV)
+
+    typed = scan_typed_csv(str(path), DATASET.schema)
+    assert typed.collect_schema() == pl.Schema({
+        'year_filled':pl.Int64(), 'rx_count':pl.Int32(), 'drug':pl.String(), 'pills_count':pl.Float32(),
+    })
+    frame = typed.collect()
+    assert frame['rx_count'].to_list() == [1204, 17, 2001]
+    assert frame['pills_count'].to_list() == pytest.approx([10000.4, 3.6, 12.0])
+
+def test_where_sends_filterable_columns_and_applies_all(tmp_path):
+    path = tmp_path / 'view.csv'
+    path.write_text(CSV)
+
+    # only the filterable column goes to tableau, by its source name
+    assert DATASET.view_filters() == {'obs':['opioid', 'benzodiazepine']}
+    # every predicate still applies locally, after the transforms
+    frame = DATASET.project(scan_typed_csv(str(path), DATASET.schema)).collect()
+    assert frame.rows() == [(2024, 17, 'benzodiazepine', 4.0)]
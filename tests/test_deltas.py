@@ -0,0 +1,45 @@
+import polars as pl
+import pytest
+
+from deltas import human_format, yoy
+
+
+@pytest.mark.parametrize(('value', 'label'), [
+    (0, '0'),
+    (999, '999'),
+    (1000, '1K'),
+    (1234, '1.23K'),
+    # half to even, like '{:.3g}'
+    (1235, '1.24K'),
+    (1245, '1.24K'),
+    (-25_000_000, '-25M'),
+    (999_500, '1M'),
+    (999_499_999_999_999, '999T'),
+    # past the last suffix the count of trillions grows
+    (999_500_000_000_000, '1000T'),
+    (10**15, '1000T'),
+    (-10**15, '-1000T'),
+    (123_456_789_012_345_678, '123000T'),
+    (None, None),
+])
+def test_human_format(value, label):
+    assert pl.select(human_format(pl.lit(value, pl.Int64))).item() == label
+
+def test_yoy():
+    frame = pl.LazyFrame({
+        'drug':['opioid'] * 6 + ['stimulant'] * 2,
+        'year_filled':[2019, 2020, 2020, 2022, 2023, 2024, 2023, 2024],
+        'rx_count':[0, 1500, 500, 1000, 2500, None, 0, 0],
+    })
+    changes = yoy(frame, ['drug']).collect()
+    assert changes.select('drug', 'year_filled', 'rx_count', 'prev', 'delta', 'pct_change', 'delta_label', 'pct_label').rows() == [
+        # no change from zero, or from the first year or across the 2021 gap
+        ('opioid', 2019, 0, None, None, None, None, None),
+        ('opioid', 2020, 2000, 0, 2000, None, '2K', None),
+        ('opioid', 2022, 1000, None, None, None, None, None),
+        ('opioid', 2023, 2500, 1000, 1500, 1.5, '1.5K', '+150.0%'),
+        # a year of only nulls sums to zero
+        ('opioid', 2024, 0, 2500, -2500, -1.0, '-2.5K', '-100.0%'),
+        ('stimulant', 2023, 0, None, None, None, None, None),
+        ('stimulant', 2024, 0, 0, 0, None, '0', None),
+    ]
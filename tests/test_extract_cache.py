@@ -0,0 +1,34 @@
+import os
+
+import polars as pl
+
+from extract_cache import ExtractCache
+
+FRAME = pl.LazyFrame({'year_filled':[2024] * 1000, 'rx_count':range(1000)})
+
+
+def test_partitions_count_towards_max_bytes(tmp_path):
+    writer = ExtractCache(cache_dir=str(tmp_path), max_bytes=2**62)
+    paths = [writer.put_partition('view', None, {}, {'year_filled':year}, FRAME) for year in (2022, 2023, 2024)]
+    # 2023 used more recently than 2022 and 2024
+    for path, used in zip(paths, (1, 3, 2)):
+        os.utime(path, (used, os.path.getmtime(path)))
+
+    cache = ExtractCache(cache_dir=str(tmp_path), max_bytes=os.path.getsize(paths[0]))
+    evicted = cache.evict()
+    assert evicted == [paths[0], paths[2]]
+    assert cache.get_partition('view', None, {}, {'year_filled':2023}) == paths[1]
+    assert not os.path.exists(os.path.dirname(paths[0]))
+
+def test_prune_partitions_keeps_requested_datasets(tmp_path):
+    old = ExtractCache(cache_dir=str(tmp_path))
+    old.put_partition('view', None, {'schema':'old'}, {'year_filled':2024}, FRAME)
+    other = old.put_partition('other', None, {}, {'year_filled':2024}, FRAME)
+
+    cache = ExtractCache(cache_dir=str(tmp_path))
+    current = cache.put_partition('view', None, {'schema':'new'}, {'year_filled':2024}, FRAME)
+    pruned = cache.prune_partitions()
+    assert len(pruned) == 1 and pruned[0].startswith('view-')
+    # the current dataset and views this run didn't read are kept
+    assert os.path.exists(current) and os.path.exists(other)
+    assert sorted(os.listdir(tmp_path / 'partitions')) == sorted([os.path.basename(os.path.dirname(os.path.dirname(p))) for p in (current, other)])
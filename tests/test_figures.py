@@ -0,0 +1,62 @@
+import base64
+
+import numpy as np
+import plotly.express as px
+import polars as pl
+
+import figures
+
+COUNTIES = ['APACHE', 'PIMA', 'YUMA']
+
+
+def values(array) -> list[float]:
+    if isinstance(array, dict):
+        array = np.frombuffer(base64.b64decode(array['bdata']), dtype=array['dtype'])
+    return [float(v) for v in array]
+
+def frame_points(fig:dict) -> dict[str, dict[str, tuple]]:
+    """
+    each frame's (x, y, size) per county, with delta encoded frame traces filled
+    in from their base trace
+    """
+    points = {}
+    for frame in fig['frames']:
+        traces = frame.get('traces', range(len(frame['data'])))
+        points[frame['name']] = {}
+        for index, trace in zip(traces, frame['data']):
+            base = fig['data'][index] if 'traces' in frame else {}
+            props = {**base, **trace, 'marker':{**base.get('marker', {}), **trace.get('marker', {})}}
+            points[frame['name']][props['name']] = (values(props['x']), values(props['y']), values(props['marker']['size']))
+    return points
+
+def test_bubble_keeps_counties_missing_early():
+    rates = pl.DataFrame([
+        {
+            'patient_county':county,
+            'fips':f'0400{i}',
+            'year_filled':year,
+            'opi_rx_per1000':float(i + year - 2000),
+            'bup_rx_per1000':float(i * 2 + year % 3),
+            'population':1000 * (i + 1) + year,
+            **{metric:1.0 for metric in ('rx_per1000', 'benzo_rx_per1000', 'stim_rx_per1000', 'andro_rx_per1000')},
+            **{count:10 for count in ('all_cs', 'opioid', 'benzodiazepine', 'stimulant', 'buprenorphine', 'androgen')},
+        }
+        for year in range(2019, 2024)
+        for i, county in enumerate(COUNTIES)
+        # no yuma rows for the first two years
+        if county != 'YUMA' or year > 2020
+    ])
+    bubble = figures.county_data(rates, {'type':'FeatureCollection', 'features':[]}, None)['opi_bup_county_rate_bubble.html']
+    expected = px.scatter(
+        rates,
+        x='opi_rx_per1000',
+        y='bup_rx_per1000',
+        size='population',
+        color='patient_county',
+        animation_frame='year_filled',
+        animation_group='patient_county',
+    ).to_dict()
+
+    assert [trace['name'] for trace in bubble['data']] == COUNTIES
+    assert frame_points(bubble) == frame_points(expected)
+    assert set(frame_points(bubble)['2023']) == set(COUNTIES)
@@ -0,0 +1,17 @@
+import numpy as np
+import plotly.graph_objects as go
+
+from images import ImageOptions, export_images
+
+
+def test_export_png(tmp_path):
+    # numpy data is written as typed arrays, which the renderer's plotly.js has to read
+    fig = go.Figure(go.Bar(x=np.arange(3), y=np.array([3.0, 1.0, 2.0])))
+    assert 'bdata' in fig.to_dict()['data'][0]['y']
+    options = ImageOptions(formats=('png', 'svg'), width=300, height=200, scale=1.0)
+    export_images({'bup.html':fig}, str(tmp_path), options)
+    png, svg = options.paths(str(tmp_path), 'bup.html')
+    with open(png, 'rb') as f:
+        assert f.read(8) == b'\x89PNG\r\n\x1a\n'
+    with open(svg) as f:
+        assert '<svg' in f.read()
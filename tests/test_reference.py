@@ -0,0 +1,81 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from reference import ReferenceData, parse_fips
+from tableau import OfflineError
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'reference')
+
+
+def fetch(reference:ReferenceData):
+    return reference.counties(), reference.state_fips('ARIZONA'), reference.county_population(['ARIZONA'], range(2022, 2025))
+
+
+def test_parse_fips():
+    with open(os.path.join(FIXTURES, 'fips.txt')) as f:
+        states, counties = parse_fips(f.read())
+    assert states.rows() == [('01', 'ALABAMA'), ('04', 'ARIZONA'), ('06', 'CALIFORNIA')]
+    assert counties.height == 16
+    assert counties.row(0) == ('04001', 'Apache County')
+
+def test_reruns_make_no_requests(reference_server, reference_data, tmp_path):
+    url, counts = reference_server
+    counties, state, pop = fetch(reference_data(url, str(tmp_path)))
+    assert counts['requests'] == 4   # geojson, fips and two acs releases
+    assert state == '04'
+    assert len(counties['features']) == 18
+    assert pop.height == 15 * 3
+    assert pop.filter(year_filled=2024)['vintage'].unique().to_list() == [2023]
+    assert 'SANTA CRUZ' in pop['county'].to_list()
+
+    assert fetch(reference_data(url, str(tmp_path)))[2].equals(pop)
+    assert counts['requests'] == 4
+
+def test_refresh_revalidates(reference_server, reference_data, tmp_path):
+    url, counts = reference_server
+    fetch(reference_data(url, str(tmp_path)))
+    fetch(reference_data(url, str(tmp_path), refresh=True))
+    assert counts['requests'] == 8
+    assert counts['not_modified'] == 4
+
+def test_offline(reference_server, reference_data, tmp_path):
+    url, counts = reference_server
+    with pytest.raises(OfflineError):
+        reference_data(url, str(tmp_path), offline=True).counties()
+    _, _, pop = fetch(reference_data(url, str(tmp_path)))
+    assert fetch(reference_data('http://127.0.0.1:9', str(tmp_path), offline=True))[2].equals(pop)
+    assert counts['requests'] == 4
+
+def test_concurrent_cold_cache_downloads_each_source_once(reference_server, reference_data, tmp_path):
+    url, counts = reference_server
+    reference = reference_data(url, str(tmp_path))
+    get = reference.session.get
+
+    def slow_get(*args, **kwargs):
+        time.sleep(0.2)
+        return get(*args, **kwargs)
+
+    reference.session.get = slow_get
+    # the county map and the populations both resolve fips, as in `fetch_all()`
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        counties = pool.submit(lambda: reference.state_fips('ARIZONA'))
+        pop = pool.submit(lambda: reference.county_population(['ARIZONA'], range(2022, 2025)))
+        assert counties.result() == '04'
+        assert pop.result().height == 15 * 3
+    assert counts['requests'] == 3
+    assert not [name for name in os.listdir(tmp_path) if not name.endswith(('.parquet', '.json'))]
+
+def test_county_population_for_several_states(reference_server, reference_data, tmp_path):
+    url, _ = reference_server
+    pop = reference_data(url, str(tmp_path)).county_population(['ARIZONA', 'CALIFORNIA'], [2023])
+    assert pop.height == 16
+    assert pop.filter(county='SANTA CRUZ').select('fips', 'state').sort('fips').rows() == [('04023', 'ARIZONA'), ('06087', 'CALIFORNIA')]
+
+def test_county_population_without_years(reference_server, reference_data, tmp_path):
+    url, _ = reference_server
+    pop = reference_data(url, str(tmp_path)).county_population(['ARIZONA'], [])
+    assert pop.is_empty()
+    assert pop.columns == ['fips', 'state', 'county', 'year_filled', 'vintage', 'population']
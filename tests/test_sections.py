@@ -0,0 +1,67 @@
+import os
+
+import polars as pl
+import pytest
+
+import sections
+
+CS_DISP = pl.DataFrame({'year_filled':[2023, 2024], 'rx_count':[120, 130]})
+
+
+@pytest.fixture
+def rendered(tmp_path, monkeypatch):
+    """
+    the sections each `render_all()` call renders, stubbed to write empty outputs
+    so only the manifest check runs
+    """
+    calls:list[list[str]] = []
+
+    def render_section(name, inputs, out_dir, images=None):
+        calls[-1].append(name)
+        for output in sections.section_outputs(name, out_dir, images):
+            open(output, 'w').close()
+        return 0.0
+
+    def render(inputs=None, force=False):
+        calls.append([])
+        sections.render_all(
+            {str(tmp_path):inputs or {'cs_disp':CS_DISP}},
+            names=['cs_dispensed'],
+            max_workers=1,
+            manifest_path=str(tmp_path / 'manifest.json'),
+            force=force,
+        )
+        return calls[-1]
+
+    monkeypatch.setattr(sections, 'render_section', render_section)
+    return render
+
+
+def test_skips_unchanged(rendered):
+    assert rendered() == ['cs_dispensed']
+    assert rendered() == []
+
+def test_rerenders_changed_input(rendered):
+    rendered()
+    assert rendered({'cs_disp':CS_DISP.with_columns(rx_count=pl.col('rx_count') + 1)}) == ['cs_dispensed']
+    assert rendered({'cs_disp':CS_DISP.with_columns(rx_count=pl.col('rx_count') + 1)}) == []
+
+def test_rerenders_changed_code(rendered, monkeypatch):
+    rendered()
+    source = sections._source
+    monkeypatch.setattr(sections, '_source', lambda code: source(code) + ('\n# edited' if code == 'figures:cs_dispensed' else ''))
+    assert rendered() == ['cs_dispensed']
+
+def test_rerenders_changed_version(rendered, monkeypatch):
+    rendered()
+    monkeypatch.setattr(pl, '__version__', f'{pl.__version__}.post1')
+    assert rendered() == ['cs_dispensed']
+
+def test_rerenders_missing_output(rendered, tmp_path):
+    rendered()
+    os.remove(tmp_path / 'total_cs.html')
+    assert rendered() == ['cs_dispensed']
+
+def test_rebuild_ignores_manifest(rendered):
+    rendered()
+    assert rendered(force=True) == ['cs_dispensed']
@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+import geometry
+from extract_cache import ExtractCache
+from reference import ReferenceData
+from serve import ReportServer
+from tableau import TableauClient
+
+
+@pytest.fixture
+def report(stand_in, monkeypatch):
+    monkeypatch.setenv('CENSUS_API_KEY', 'test')
+    reference = ReferenceData(cache_dir='reference')
+    reference.counties_url = f'{stand_in.url}/counties.geojson'
+    reference.fips_url = f'{stand_in.url}/fips.txt'
+    reference.acs_url = f'{stand_in.url}/data/{{vintage}}/acs/acs5'
+    with TableauClient(cache_dir='tableau', extract_cache=ExtractCache(cache_dir='extracts')) as client:
+        yield ReportServer(client, reference, range(2022, 2025))
+
+def test_map_traces_share_the_geojson(report):
+    figure = report.figure_json('county_map_combined.html', {})
+    traces = json.loads(figure)['data']
+    assert len(traces) > 1
+    assert all(trace['geojson'] == geometry.SHARED_GEOJSON for trace in traces)
+    # the geometry is sent once, on its own
+    assert json.loads(report.geojson)['features']
+    assert b'"coordinates"' not in figure
+
+def test_page_escapes_the_query(report):
+    page = report.page('total_cs.html', 'years=</script><script>alert(1)//')
+    script = page.split('<body>', 1)[1]
+    assert script.count('</script>') == 1
+    assert '<\\/script><script>alert(1)//' in script
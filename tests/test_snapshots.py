@@ -0,0 +1,41 @@
+import polars as pl
+import pytest
+
+import snapshots
+
+FRAME = pl.DataFrame({
+    'patient_county':['PIMA', 'YUMA', None],
+    'year_filled':pl.Series([2023, 2024, 2024], dtype=pl.Int64()),
+    'rx_count':pl.Series([120, 0, 7], dtype=pl.Int32()),
+    'opi_rx_per1000':pl.Series([1.5, None, 0.25], dtype=pl.Float32()),
+})
+
+
+def test_publish_and_load_round_trip(tmp_path):
+    snapshots.publish({'rates':FRAME}, 2024, root=str(tmp_path))
+
+    loaded = snapshots.load('rates', 2024, root=str(tmp_path), verify=True)
+    assert loaded.schema == FRAME.schema
+    assert loaded.equals(FRAME)
+    assert snapshots.scan('rates', 2024, root=str(tmp_path)).collect().equals(FRAME)
+    entry = snapshots.manifest(2024, root=str(tmp_path))['datasets']['rates']
+    assert entry['version'] == 1
+    assert entry['schema'] == {col:str(dtype) for col, dtype in FRAME.schema.items()}
+
+def test_publish_versions_only_changed_frames(tmp_path):
+    snapshots.publish({'rates':FRAME}, 2024, root=str(tmp_path))
+    snapshots.publish({'rates':FRAME.clone()}, 2024, root=str(tmp_path))
+    assert snapshots.manifest(2024, root=str(tmp_path))['datasets']['rates']['version'] == 1
+
+    changed = FRAME.with_columns(rx_count=pl.col('rx_count') + 1)
+    snapshots.publish({'rates':changed}, 2024, root=str(tmp_path))
+    assert snapshots.load('rates', 2024, root=str(tmp_path)).equals(changed)
+    assert snapshots.load('rates', 2024, version=1, root=str(tmp_path)).equals(FRAME)
+
+def test_load_verify_catches_a_changed_file(tmp_path):
+    snapshots.publish({'rates':FRAME}, 2024, root=str(tmp_path))
+    with open(snapshots.path('rates', 2024, root=str(tmp_path)), 'r+b') as f:
+        f.seek(-16, 2)
+        f.write(b'\0' * 16)
+    with pytest.raises(ValueError, match='checksum'):
+        snapshots.load('rates', 2024, root=str(tmp_path), verify=True)
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+from tableauserverclient.server.endpoint.exceptions import InternalServerError
+
+from extract_cache import ExtractCache
+from tableau import TableauClient, find_view_luid, lazyframe_from_view_id
+
+WORKBOOK = 'annual report'
+YEAR = {'start_year':2023, 'end_year':2023}
+
+
+def test_one_sign_in_per_client(stand_in):
+    with TableauClient(cache_dir='tableau') as client:
+        luids = [find_view_luid(view, WORKBOOK, client=client) for view in ('Total CS Dispensed', 'Bup Dispensed', 'OBS Dispensed')]
+        frames = [lazyframe_from_view_id(luid, YEAR, client=client).collect() for luid in luids]
+    assert client.sign_ins == 1
+    assert stand_in.sign_ins == 1
+    assert all(frame.height for frame in frames)
+
+def test_signs_in_again_after_401(stand_in):
+    with TableauClient(cache_dir='tableau') as client:
+        luid = find_view_luid('Bup Dispensed', WORKBOOK, client=client)
+        lazyframe_from_view_id(luid, YEAR, client=client).collect()
+        stand_in.expire_token()
+        lazyframe_from_view_id(luid, YEAR, client=client).collect()
+        lazyframe_from_view_id(luid, YEAR, client=client).collect()
+    assert client.sign_ins == 2
+    assert stand_in.sign_ins == 2
+
+def test_signs_in_again_after_token_ttl(stand_in):
+    with TableauClient(cache_dir='tableau', token_ttl=0.5) as client:
+        luid = find_view_luid('Bup Dispensed', WORKBOOK, client=client)
+        lazyframe_from_view_id(luid, YEAR, client=client).collect()
+        time.sleep(0.6)
+        lazyframe_from_view_id(luid, YEAR, client=client).collect()
+        lazyframe_from_view_id(luid, YEAR, client=client).collect()
+    assert client.sign_ins == 2
+    assert stand_in.sign_ins == 2
+
+def test_view_index_is_reused_across_clients(stand_in):
+    with TableauClient(cache_dir='tableau') as client:
+        find_view_luid('Bup Dispensed', WORKBOOK, client=client)
+    with TableauClient(cache_dir='tableau') as client:
+        find_view_luid('Total CS Dispensed', WORKBOOK, client=client)
+    # the second lookup is answered from the index on disk without signing in
+    assert client.sign_ins == 0
+    assert stand_in.sign_ins == 1
+
+def test_retries_server_errors(stand_in):
+    stand_in.failing_exports = 2
+    with TableauClient(cache_dir='tableau', backoff=0.01) as client:
+        luid = find_view_luid('Bup Dispensed', WORKBOOK, client=client)
+        assert lazyframe_from_view_id(luid, YEAR, client=client).collect().height
+    assert stand_in.failing_exports == 0
+
+def test_no_retries(stand_in):
+    stand_in.failing_exports = 1
+    with TableauClient(cache_dir='tableau', retries=0) as client:
+        luid = find_view_luid('Bup Dispensed', WORKBOOK, client=client)
+        with pytest.raises(InternalServerError):
+            lazyframe_from_view_id(luid, YEAR, client=client)
+    with pytest.raises(ValueError):
+        TableauClient(retries=-1)
+
+def test_download_is_one_request(stand_in):
+    with TableauClient(cache_dir='tableau') as client:
+        luid = find_view_luid('Bup Dispensed', WORKBOOK, client=client)
+        requests = stand_in.requests
+        lazyframe_from_view_id(luid, YEAR, client=client).collect()
+    assert stand_in.requests == requests + 1
+    assert [download['view'] for download in client.downloads] == ['Bup Dispensed']
+
+def test_partitioned_export_resumes(stand_in):
+    partition_by = {'drug type':['opioid', 'benzodiazepine']}
+    stand_in.failing_exports = 1
+    with TableauClient(cache_dir='tableau', extract_cache=ExtractCache(cache_dir='extracts'), retries=0) as client:
+        luid = find_view_luid('Total CS by Patient County', WORKBOOK, client=client)
+        # one chunk at a time, so the first, opioid, is the one that fails
+        with pytest.raises(InternalServerError):
+            lazyframe_from_view_id(luid, YEAR, partition_by=partition_by, max_workers=1, client=client)
+        assert [download['view'] for download in client.downloads] == ['Total CS by Patient County']
+
+        requests = stand_in.requests
+        frame = lazyframe_from_view_id(luid, YEAR, partition_by=partition_by, max_workers=1, client=client).collect()
+    # only the failed chunk is pulled again
+    assert stand_in.requests == requests + 1
+    assert len(client.downloads) == 2
+    assert sorted(frame['drug type'].unique()) == ['benzodiazepine', 'opioid']
@@ -0,0 +1,49 @@
+import polars as pl
+
+from extract_cache import ExtractCache
+from reference import ReferenceData
+from tableau import TableauClient
+from yearly_figures import derive, fetch_all
+
+YEARS = range(2022, 2025)
+
+
+def fetch(stand_in, mutable_years:set[int]|None=None, max_downloads:int=8) -> dict:
+    reference = ReferenceData(cache_dir='reference')
+    reference.counties_url = f'{stand_in.url}/counties.geojson'
+    reference.fips_url = f'{stand_in.url}/fips.txt'
+    reference.acs_url = f'{stand_in.url}/data/{{vintage}}/acs/acs5'
+    with TableauClient(cache_dir='tableau', extract_cache=ExtractCache(cache_dir='extracts'), max_downloads=max_downloads) as client:
+        return fetch_all(client, reference, YEARS, mutable_years=mutable_years)
+
+def test_no_mutable_years_pulls_nothing_again(stand_in, monkeypatch):
+    monkeypatch.setenv('CENSUS_API_KEY', 'test')
+    fetch(stand_in)
+    requests = stand_in.requests
+    fetch(stand_in, mutable_years=set())
+    assert stand_in.requests == requests
+    # by default the last year is pulled again
+    fetch(stand_in)
+    assert stand_in.requests > requests
+
+def test_exports_share_one_bound(stand_in, monkeypatch):
+    monkeypatch.setenv('CENSUS_API_KEY', 'test')
+    stand_in.export_delay = 0.05
+    # six views of three years each, on nested thread pools
+    fetch(stand_in, max_downloads=2)
+    assert stand_in.peak_exports == 2
+
+def test_county_rates_use_the_report_state(reference_server, reference_data, tmp_path):
+    url, _ = reference_server
+    reference = reference_data(url, str(tmp_path))
+    pop = reference.county_population(['ARIZONA', 'CALIFORNIA'], [2023])
+    counts = pl.LazyFrame({
+        'county':['SANTA CRUZ', 'SANTA CRUZ'],
+        'year_filled':[2023, 2023],
+        'drug type':['All', 'opioid'],
+        'rx_count':[1000, 100],
+    })
+    rates = derive({'rx_pat_county':counts, 'pop':pop.lazy()}, {'pat_county_rates'})['pat_county_rates'].collect()
+    az_population = pop.filter(fips='04023')['population'].item()
+    assert rates.select('patient_county', 'fips', 'population').rows() == [('SANTA CRUZ', '04023', az_population)]
+    assert rates['rx_per1000'].item() == 1000 / az_population * 1000
@@ -1,567 +1,335 @@
+import argparse
 import os
-import re
-import sys
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
 
-import plotly.express as px
-import plotly.graph_objects as go
 import polars as pl
-import requests
 from dotenv import load_dotenv
-from plotly.subplots import make_subplots
 
+import deltas
+import geometry
+import sections
+import snapshots
 import tableau
-
+from datasets import DATASETS, DRUG_TYPES
+from extract_cache import ExtractCache
+from images import ImageOptions
+from reference import LATEST_ACS5, ReferenceData
+from telemetry import span, tracer
 
 WORKBOOK = 'annual report'
 YEAR = 2024
+WINDOW = 5  # years before the report year each report shows
+STATE = 'ARIZONA'
 load_dotenv()
-filters = {
-    'start_year':YEAR-5,
-    'end_year':YEAR
+# the per 1000 residents rates in `pat_county_rates` and the counts they're computed from
+RATES = {
+    'rx_per1000':'all_cs',
+    'opi_rx_per1000':'opioid',
+    'benzo_rx_per1000':'benzodiazepine',
+    'stim_rx_per1000':'stimulant',
+    'andro_rx_per1000':'androgen',
+    'bup_rx_per1000':'buprenorphine',
+}
+# what each frame from `derive()` is built from, `DATASETS` keys or `pop`
+FRAME_SOURCES = {
+    'pat_county_rates':('rx_pat_county', 'pop'),
+    'cs_disp':('cs_disp',),
+    # 'cs_disp_sched':('cs_disp_sched',), # not interesting this year
+    'opi':('obs',),
+    'benzo':('obs',),
+    'stims':('obs',),
+    'benzo_oos':('oos',),
+    'andro_oos':('oos',),
+    'bup_rx':('bup_rx',),
+    'pills':('pills',),
+    'obs_yoy':('obs',),
+    'oos_yoy':('oos',),
+    'yoy':tuple(deltas.DIMENSIONS),
+    'movers':tuple(deltas.DIMENSIONS),
+}
+# report wide frames no chart takes, derived whenever their sources are fetched anyway
+REPORT_FRAMES = ('yoy', 'movers')
+# the drug type each per drug frame is filtered to
+FRAME_DRUGS = {
+    'opi':'opioid',
+    'benzo':'benzodiazepine',
+    'stims':'stimulant',
+    'benzo_oos':'benzodiazepine',
+    'andro_oos':'androgen',
 }
 
 
-def human_format(num):
-    num = float('{:.3g}'.format(num))
-    magnitude = 0
-    while abs(num) >= 1000:
-        magnitude += 1
-        num /= 1000.0
-    return '{}{}'.format('{:f}'.format(num).rstrip('0').rstrip('.'), ['', 'K', 'M', 'B', 'T'][magnitude])
-
-def county_data():
-    # ---
-    # county data
-    # ---
-    print('generating county data...')
-
-    counties = requests.get('https://raw.githubusercontent.com/plotly/datasets/master/geojson-counties-fips.json').json()
-
-    fips_txt = requests.get('https://transition.fcc.gov/oet/info/maps/census/fips/fips.txt').text
-    sections = re.split(r'-+\s+-+', fips_txt)
-
-    def parse_fips_data(section:str, col_names:list) -> pl.LazyFrame:
-        data_dict = {col_names[0]: [], col_names[1]: []}
-        for line in section.strip().splitlines():
-            if not line:
-                break
-            row = re.split(r'\s{2,}', line.strip())
-            data_dict[col_names[0]].append(row[0])
-            data_dict[col_names[1]].append(row[1])
-        return pl.LazyFrame(data_dict)
-
-    fips_state = parse_fips_data(sections[1], ['fips', 'state']).collect()
-    fips = parse_fips_data(sections[2], ['fips', 'county'])
-
-    CENSUS_API_KEY = os.environ.get('CENSUS_API_KEY', 'CENSUS_API_KEY missing from .env file')
-    url = 'https://api.census.gov/data/2023/acs/acs5'   # may need to update as new census completed 2028
-    params = {
-        'get':'B01003_001E',
-        'for':'county:*',
-        'in':f'state:{fips_state.filter(pl.col('state') == 'ARIZONA')['fips'].item()}',
-        'key':CENSUS_API_KEY
+def parse_years(text:str) -> list[int]:
+    """
+    parses report years given as a range, a comma separated list or both
+
+    args:
+        text: eg '2024', '2019-2025' or '2019,2022-2024'
+
+    returns:
+        the sorted report years
+    """
+    years:set[int] = set()
+    for part in text.split(','):
+        first, _, last = part.strip().partition('-')
+        years.update(range(int(first), int(last or first) + 1))
+    if not years:
+        raise ValueError(f'no years in {text!r}')
+    return sorted(years)
+
+def report_window(year:int) -> range:
+    """
+    returns:
+        the years shown in the report for `year`
+    """
+    return range(year - WINDOW, year + 1)
+
+def fetch_view(client:tableau.TableauClient, key:str, years:range, mutable_years:set[int]) -> pl.LazyFrame:
+    dataset = DATASETS[key]
+    luid = tableau.find_view_luid(view_name=dataset.view, workbook_name=WORKBOOK, client=client)
+    return dataset.project(tableau.lazyframe_from_view_years(luid, years, mutable_years, filters=dataset.view_filters(), schema=dataset.schema, client=client))
+
+def fetch_all(
+    client:tableau.TableauClient,
+    reference:ReferenceData,
+    years:range,
+    sources:set[str]|None=None,
+    max_workers:int=8,
+    mutable_years:set[int]|None=None,
+    acs_vintage:int=LATEST_ACS5
+) -> dict[str, Any]:
+    """
+    starts every tableau export and external download at once on a bounded thread pool
+
+    args:
+        client: the `TableauClient` shared by all the view exports
+        reference: the `ReferenceData` cache for the county geojson and populations
+        years: every year any of the reports shows, pulled once for all of them
+        sources: optional keys to fetch, see `plan()`, defaults to everything
+        max_workers: the most datasets fetched at one time, each view's years are
+            exported on their own threads but never more than the client's
+            `max_downloads` exports at once across all of them
+        mutable_years: years pulled again even if already cached, defaults to the
+            last of `years`, an empty set pulls only what isn't cached
+        acs_vintage: the newest acs 5 year release populations are taken from, later
+            years use it too
+
+    returns:
+        a dict of `DATASETS` keys to projected LazyFrames over the downloaded
+        extracts, plus `counties` (simplified county geojson for `STATE`) and `pop`
+        (county populations for each of `years`)
+    """
+    print('fetching data...')
+    start = time.perf_counter()
+    tasks:dict[str, Callable[[], Any]] = {
+        'counties':lambda: geometry.prepare_state_geometry(reference.counties(), reference.state_fips(STATE)),
+        'pop':lambda: reference.county_population([STATE], years, acs_vintage).lazy(),
+    }
+    for key in DATASETS:
+        tasks[key] = lambda key=key: fetch_view(client, key, years, mutable_years if mutable_years is not None else {years[-1]})
+    if sources is not None:
+        tasks = {key:task for key, task in tasks.items() if key in sources}
+    if DATASETS.keys() & tasks.keys():
+        # warm the view index once so the exports don't race to build it
+        client.view_index(WORKBOOK)
+
+    def run(key:str) -> Any:
+        with span(f'fetch.{key}'):
+            return tasks[key]()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {key:pool.submit(run, key) for key in tasks}
+        data = {key:future.result() for key, future in futures.items()}
+    if client.extract_cache is not None and DATASETS.keys() <= tasks.keys():
+        # every view's current datasets were just requested, older pulls of them are orphaned
+        for name in client.extract_cache.prune_partitions():
+            print(f'pruned stale extract partitions/{name}')
+    print(f'fetched {len(data)} datasets in {time.perf_counter() - start:.2f}s')
+    return data
+
+def window(data:dict[str, Any], years:range) -> dict[str, Any]:
+    """
+    slices the fetched datasets to a span of years, lazily, so every report year
+    reads the same extracts
+
+    args:
+        data: the output of `fetch_all()`
+        years: the years to keep, eg `report_window(year)`
+
+    returns:
+        `data` with each of the `DATASETS` limited to `years`
+    """
+    return {
+        key:value.filter(pl.col('year_filled').is_between(years[0], years[-1])) if key in DATASETS else value
+        for key, value in data.items()
     }
 
-    response = requests.get(url, params=params)
-
-    if response.status_code == 200:
-        data = response.json()
-        county_pop_dict = {'county':[], 'population':[]}
-        census_counties = data[1:]
-
-        for county in census_counties:
-            population, state, county = county
-            county_pop_dict['population'].append(int(population))
-            county_pop_dict['county'].append(f'{state}{county}')
-
-        county_pop_df = pl.LazyFrame(county_pop_dict)
-    else:
-        sys.exit(f'error: {response.status_code}, {response.text}')
-
-    pop = (
-        county_pop_df.join(fips, left_on='county', right_on='fips', how='left', coalesce=True)
-        .select(
-            pl.col('county').alias('fips'),
-            pl.col('county_right').str.to_uppercase().str.strip_suffix(' COUNTY').alias('county'),
-            pl.col('population')
-        )
-    )
-
-    total_cs_pat_county = tableau.find_view_luid(view_name='Total CS by Patient County', workbook_name=WORKBOOK)
-
-    rx_pat_county = (
-        tableau.lazyframe_from_view_id(total_cs_pat_county, filters=filters, infer_schema_length=100)
-        .select(
-            pl.col('Orig Patient County').str.to_uppercase().alias('county'),
-            pl.col('Year of Filled At').alias('year_filled'),
-            pl.col('drug type'),
-            pl.col('Prescription Count').str.replace_all(',','').cast(pl.Int32).alias('rx_count')
-        )
-        .collect()
-        .pivot('drug type', index=['county', 'year_filled'], values='rx_count')
-        .lazy()
-        .rename({'All':'all_cs'})
-    )
-
-    pat_county_rates = (
-        rx_pat_county.join(pop, on='county', how='left', coalesce=True)
-        .with_columns(
-            ((pl.col('all_cs') / pl.col('population')) * pl.lit(1000)).alias('rx_per1000'),
-            ((pl.col('opioid') / pl.col('population')) * pl.lit(1000)).alias('opi_rx_per1000'),
-            ((pl.col('benzodiazepine') / pl.col('population')) * pl.lit(1000)).alias('benzo_rx_per1000'),
-            ((pl.col('stimulant') / pl.col('population')) * pl.lit(1000)).alias('stim_rx_per1000'),
-            ((pl.col('androgen') / pl.col('population')) * pl.lit(1000)).alias('andro_rx_per1000'),
-            ((pl.col('buprenorphine') / pl.col('population')) * pl.lit(1000)).alias('bup_rx_per1000'),
-        )
-        .rename(
-            {'county':'patient_county'}
-        )
-        .sort('year_filled')
-        .collect()
-    )
-
-    fig = make_subplots(
-        rows=2, cols=3,
-        subplot_titles=(
-            'all_cs', 'opioids', 'benzodiazepines', 'stimulants', 'buprenorphine', 'androgens'
-        ),
-        vertical_spacing=0.04,
-        horizontal_spacing=.005,
-        specs=[
-            [{'type': 'geo'}, {'type': 'geo'}, {'type': 'geo'}],
-            [{'type': 'geo'}, {'type': 'geo'}, {'type': 'geo'}]
-        ]
-    )
-
-    metrics = [('rx_per1000','all_cs'), ('opi_rx_per1000','opioid'), ('benzo_rx_per1000','benzodiazepine'), ('stim_rx_per1000','stimulant'), ('bup_rx_per1000','buprenorphine'), ('andro_rx_per1000','androgen')]
-    positions = [(1, 1), (1, 2), (1, 3), (2, 1), (2, 2), (2,3)]
-    for (row, col), metric in zip(positions, metrics):
-        obbs_year = pat_county_rates.filter(pl.col('year_filled') == pl.col('year_filled').min())
-        fig.add_trace(go.Choropleth(
-            geojson=counties,
-            locations=obbs_year['fips'],
-            z=obbs_year[metric[0]],
-            marker_opacity=1,
-            marker_line_width=0,
-            showscale=(row == 1 and col == 1),
-            colorbar_showticklabels=False,
-            hovertext=obbs_year['patient_county'],
-            hoverinfo="text+z",
-            customdata=obbs_year[[metric[1], 'population']],
-            hovertemplate=(
-                '<b>%{hovertext}</b><br>'
-                f'{metric[0]}: %{{z:.2f}}<br>'
-                f'{metric[1]}: %{{customdata[0]:.3s}}<br>'
-                'population: %{customdata[1]:.3s}<br>'
-                '<extra></extra>'
+def derive(data:dict[str, Any], frames:set[str]|None=None, drugs:dict[str, str]|None=None) -> dict[str, pl.LazyFrame]:
+    """
+    builds the frames the charts need as lazy queries over the fetched datasets
+
+    args:
+        data: the output of `fetch_all()`
+        frames: optional names of the frames to build, defaults to all of them,
+            `data` only needs the sources `FRAME_SOURCES` lists for these
+        drugs: optional drug types replacing those in `FRAME_DRUGS`, eg
+            {'benzo_oos':'stimulant'}
+
+    returns:
+        a dict of chart input names to LazyFrames, meant to be collected together
+        with `collect_frames()`
+    """
+    def pat_county_rates() -> pl.LazyFrame:
+        rx_pat_county = (
+            data['rx_pat_county']
+            .group_by('county', 'year_filled')
+            .agg(
+                pl.col('rx_count').filter(pl.col('drug type') == 'All').first().alias('all_cs'),
+                *[pl.col('rx_count').filter(pl.col('drug type') == drug).first().alias(drug) for drug in DRUG_TYPES]
             )
-        ), row=row, col=col)
-
-    frames = []
-    for year in pat_county_rates['year_filled'].unique().sort():
-        obbs_year = pat_county_rates.filter(pl.col('year_filled') == year)
-        frame_data = []
-        for metric in metrics:
-            frame_data.append(go.Choropleth(
-                locations=obbs_year['fips'],
-                z=obbs_year[metric[0]],
-                colorbar_showticklabels=False,
-                customdata=obbs_year[[metric[1], 'population', 'year_filled']],
-            ))
-        frame = go.Frame(data=frame_data, name=str(year))
-        frames.append(frame)
-
-    fig.frames = frames
-
-    fig.update_layout(
-        margin=dict(l=10, r=10, t=20, b=10),
-        updatemenus=[{
-            'type': 'buttons',
-            'showactive': True,
-            'x': 0.1,
-            'xanchor': 'left',
-            'y': -0.05,
-            'yanchor': 'top',
-            'direction': 'left',
-            'buttons': [
-                {
-                    'label': '▶',
-                    'method': 'animate',
-                    'args': [None, {'frame': {'duration': 1000, 'redraw': True}, 'fromcurrent': True}]
-                },
-                {
-                    'label': '⏸',
-                    'method': 'animate',
-                    'args': [[None], {'frame': {'duration': 0, 'redraw': True}, 'mode': 'immediate'}]
-                }
-            ]
-        }],
-        sliders=[{
-            'active': 0,
-            'x': 0.2,
-            'len': 0.8,
-            'steps': [
-                {
-                    'args': [[frame.name], {'frame': {'duration': 0, 'redraw': True}, 'mode': 'immediate'}],
-                    'label': frame.name,
-                    'method': 'animate'
-                }
-                for frame in frames
-            ],
-            'transition': {'duration': 0},
-            'currentvalue': {
-                'prefix': 'year: ',
-                'visible': True,
-                'xanchor': 'right'
-            }
-        }]
-    )
-
-    for row, col in positions:
-        fig.update_geos(projection_type='mercator', fitbounds='locations', row=row, col=col)
-
-    fig.write_html(f'charts/{YEAR}/county_map_combined.html', config={'displayModeBar':False} ,include_plotlyjs='cdn')
-
-    # county_rate_line = px.line(opi_bup_benz_stim, x='year_filled', y='rx_per1000', color='patient_county', color_discrete_sequence=px.colors.qualitative.Light24, title='cs prescription rate by patient county')
-    # county_rate_line.write_image('data/charts/county_rates.png')
-    # county_rate_line.write_html('data/charts/county_rates.html', include_plotlyjs='cdn')
-
-    opi_bup_county_rate_bubble = px.scatter(
-        pat_county_rates,
-        x='opi_rx_per1000',
-        y='bup_rx_per1000',
-        size='population',
-        color='patient_county',
-        color_discrete_sequence=px.colors.qualitative.Light24,
-        animation_frame='year_filled',
-        animation_group='patient_county',
-        title='opioid vs buprenorphine prescription rate by patient county'
-    )
-    opi_bup_county_rate_bubble.update_traces(marker=dict(sizemin=5))
-    opi_bup_county_rate_bubble.write_html(f'charts/{YEAR}/opi_bup_county_rate_bubble.html', include_plotlyjs='cdn')
-
-    # county_rate_map = px.choropleth_map(
-    #     data_frame=pat_county_rates,
-    #     geojson=counties,
-    #     locations='fips',
-    #     color='rx_per1000',
-    #     map_style='carto-positron',
-    #     center = {"lat": 34.2744, "lon": -111.6602},
-    #     opacity=1,
-    #     zoom=5,
-    #     hover_data={'patient_county':True, 'rx_per1000':':.2f', 'all_cs':':,d', 'population':':,d', 'fips':False},
-    #     title='cs prescription rate by patient county',
-    #     animation_frame='year_filled'
-    # )
-    # county_rate_map.write_html('charts/2024/county_map.html', include_plotlyjs='cdn')
-
-    print('county data complete')
-
-def cs_dispensed():
-    # ---
-    # cs dispensed
-    # ---
-    print('generating total cs charts...')
-
-    total_cs = tableau.find_view_luid(view_name='Total CS Dispensed', workbook_name=WORKBOOK)
-
-    cs_disp = (
-        tableau.lazyframe_from_view_id(total_cs, filters=filters, infer_schema_length=100)
-        .select(
-            pl.col('Year of Filled At').alias('year_filled'),
-            pl.col('Prescription Count').str.replace_all(',','').cast(pl.Int32).alias('rx_count')
         )
-        .sort('year_filled')
-        .collect()
-    )
-
-    cs_disp_line = px.line(cs_disp, x='year_filled', y='rx_count', title='cs dispensations', range_y=[0,22000000])
-    cs_disp_line.write_html('charts/2024/total_cs.html', include_plotlyjs='cdn')
-    print('total cs charts complete')
 
-
-def cs_by_sched():
-    # ---
-    # cs by sched
-    # ---
-
-    print('generating cs by sched...')
-
-    total_cs_sched = tableau.find_view_luid(view_name='Total CS Drug schedule', workbook_name=WORKBOOK)
-
-    cs_disp_sched = (
-        tableau.lazyframe_from_view_id(total_cs_sched, filters=filters, infer_schema_length=100)
-        .select(
-            pl.col('Year of Filled At').alias('year_filled'),
-            pl.col('Prescription Count').str.replace_all(',','').cast(pl.Int32).alias('rx_count'),
-            pl.col('Drug Schedule').alias('drug_schedule')
-        )
-        .sort('year_filled')
-        .collect()
-    )
-
-    cs_disp_sched_tree_map = px.treemap(cs_disp_sched, path=[px.Constant('all drugs'), 'year_filled', 'drug_schedule'], values='rx_count', color='drug_schedule')
-    cs_disp_sched_tree_map.update_traces(marker=dict(cornerradius=5))
-    cs_disp_sched_tree_map.write_html('charts/2024/cs_disp_sched_tree_map.html', include_plotlyjs='cdn')
-    print('cs by sched complete')
-
-def obs():
-    # ---
-    # opi, benzo, stims
-    # ---
-    print('generating opi benzo stims...')
-
-    obs_luid = tableau.find_view_luid(view_name='OBS Dispensed', workbook_name=WORKBOOK)
-    obs = tableau.lazyframe_from_view_id(obs_luid, filters=filters, infer_schema_length=100).collect()
-
-    opi = (
-        obs
-        .select(
-            pl.col('Year of Filled At').alias('year_filled'),
-            pl.col('Prescription Count').str.replace_all(',','').cast(pl.Int32).alias('rx_count'),
-            pl.col('obs').alias('drug')
-        )
-        .filter(pl.col('drug') == 'opioid')
-        .sort('year_filled')
-    )
-
-    benzo = (
-        obs
-        .select(
-            pl.col('Year of Filled At').alias('year_filled'),
-            pl.col('Prescription Count').str.replace_all(',','').cast(pl.Int32).alias('rx_count'),
-            pl.col('obs').alias('drug')
-        )
-        .filter(pl.col('drug') == 'benzodiazepine')
-        .sort('year_filled')
-    )
-
-    stims = (
-        obs
-        .select(
-            pl.col('Year of Filled At').alias('year_filled'),
-            pl.col('Prescription Count').str.replace_all(',','').cast(pl.Int32).alias('rx_count'),
-            pl.col('obs').alias('drug')
-        )
-        .filter(pl.col('drug') == 'stimulant')
-        .sort('year_filled')
-    )
-
-    x1 = benzo['year_filled'].max()
-    x0 = x1 - 1
-    y0 = benzo.filter(pl.col('year_filled') == (pl.col('year_filled').max() - 1))['rx_count'].item()
-    y1 = benzo.filter(pl.col('year_filled') == pl.col('year_filled').max())['rx_count'].item()
-    delta = human_format(y1 - y0)
-
-    layout = dict(
-        hoversubplots='axis',
-        title=dict(text='dispensations by drug type'),
-        hovermode='x',
-        grid=dict(rows=3, columns=1),
-        shapes=[
-            dict(type='rect',
-                x0=x0, y0=y0, x1=x1, y1=y1,
-                fillcolor='MediumPurple',
-                line_color='MediumPurple',
-                opacity=0.25,
-                xref='x', yref='y2'
+        return (
+            rx_pat_county
+            # the counts only name the county, of a `STATE` patient, matched to its fips
+            # once, populations are per fips and year
+            .join(data['pop'].filter(pl.col('state') == STATE).select('county', 'fips').unique(), on='county', how='left')
+            .join(data['pop'].select('fips', 'year_filled', 'population'), on=['fips', 'year_filled'], how='left')
+            .with_columns(((pl.col(count) / pl.col('population')) * pl.lit(1000)).alias(rate) for rate, count in RATES.items())
+            .rename(
+                {'county':'patient_county'}
             )
-        ],
-        annotations=[
-            dict(
-                x=x1 - 0.01,
-                y=y0 + (y1 - y0) * 0.03,
-                text=f'benzodiazepine increase: {delta}',
-                showarrow=False,
-                font=dict(color='MediumPurple', size=10),
-                align='right',
-                xanchor='right',
-                yanchor='bottom',
-                xref='x', yref='y2'
-            )
-        ]
-    )
-
-    data = [
-        go.Scatter(x=opi['year_filled'], y = opi['rx_count'], xaxis='x', yaxis='y', name='opioid', hovertemplate='%{y:.3s}'),
-        go.Scatter(x=benzo['year_filled'], y = benzo['rx_count'], xaxis='x', yaxis='y2', name='benzodiazepine', hovertemplate='%{y:.3s}'),
-        go.Scatter(x=stims['year_filled'], y = stims['rx_count'], xaxis='x', yaxis='y3', name='stimulant', hovertemplate='%{y:.3s}'),
-    ]
-
-    obs_stacked = go.Figure(data=data, layout=layout)
-
-    obs_stacked.write_html('charts/2024/obs_stacked.html')
-    print('opi benzo stims generated')
-
-def oos_rx():
-    # ---
-    # oos_rx
-    # ---
-    print('generating oos...')
-
-    oos_luid = tableau.find_view_luid(view_name='Total CS AZ?', workbook_name=WORKBOOK)
-    oos = tableau.lazyframe_from_view_id(oos_luid, filters=filters, infer_schema_length=100)
-
-    benzo_oos = (
-        oos
-        .select(
-            pl.col('Year of Filled At').alias('year_filled'),
-            pl.col('Prescription Count').str.replace_all(',','').cast(pl.Int32).alias('rx_count'),
-            pl.col('Prescriber AZ ?').alias('presc_az'),
-            pl.col('drug type')
-        )
-        .filter(pl.col('drug type') == 'benzodiazepine')
-        .sort('year_filled')
-        .collect()
-    )
-
-    benzo_oos_fig = px.line(benzo_oos, x='year_filled', y='rx_count', color='presc_az', title='benzodiazepine dispensations by prescriber state', hover_data={'presc_az':True, 'year_filled':True, 'rx_count':':.3s'})
-    # benzo_oos_fig.add_vrect(x0=benzo_oos['year_filled'].max() - 1, x1=benzo_oos['year_filled'].max(),
-    #                         annotation_text='increase in out of state rx', annotation_position='bottom right',
-    #                         fillcolor='red', opacity=0.25, line_width=0)
-    layout = dict(
-        hoversubplots='axis',
-        hovermode='x'
-    )
-    benzo_oos_fig.update_layout(layout)
-
-    x1 = benzo_oos['year_filled'].max()
-    x0 = x1 - 1
-    y0 = benzo_oos.filter((pl.col('year_filled') == (pl.col('year_filled').max() - 1)) & pl.col('presc_az').not_())['rx_count'].item()
-    y1 = benzo_oos.filter((pl.col('year_filled') == pl.col('year_filled').max()) & pl.col('presc_az').not_())['rx_count'].item()
-
-    delta = human_format(y1 - y0)
-
-    benzo_oos_fig.add_shape(type='rect',
-        x0=x0, y0=y0, x1=x1, y1=y1,
-        fillcolor='MediumPurple',
-        line_color='MediumPurple',
-        opacity=0.25
-    )
-    benzo_oos_fig.update_shapes(dict(xref='x', yref='y'))
-    benzo_oos_fig.add_annotation(
-        x=x1 - 0.01,
-        y=y0 + (y1 - y0) * 0.03,
-        text=f'out of state increase: {delta}',
-        showarrow=False,
-        font=dict(color='MediumPurple', size=10),
-        align='right',
-        xanchor='right',
-        yanchor='bottom',
-    )
-    benzo_oos_fig.write_html('charts/2024/benzo_oos.html', include_plotlyjs='cdn')
-
-    print('benzo oos complete')
-
-    andro_oos = (
-        oos
-        .select(
-            pl.col('Year of Filled At').alias('year_filled'),
-            pl.col('Prescription Count').str.replace_all(',','').cast(pl.Int32).alias('rx_count'),
-            pl.col('Prescriber AZ ?').alias('presc_az'),
-            pl.col('drug type')
-        )
-        .filter(pl.col('drug type') == 'androgen')
-        .sort('year_filled')
-        .collect()
-    )
-
-    andro_oos_fig = px.line(andro_oos, x='year_filled', y='rx_count', color='presc_az', title='androgen dispensations by prescriber state', hover_data={'presc_az':True, 'year_filled':True, 'rx_count':':.3s'})
-    layout = dict(
-        hoversubplots='axis',
-        hovermode='x'
-    )
-    andro_oos_fig.update_layout(layout)
-
-    x1 = andro_oos['year_filled'].max()
-    x0 = x1 - 1
-    y0 = andro_oos.filter((pl.col('year_filled') == (pl.col('year_filled').max() - 1)) & pl.col('presc_az').not_())['rx_count'].item()
-    y1 = andro_oos.filter((pl.col('year_filled') == pl.col('year_filled').max()) & pl.col('presc_az').not_())['rx_count'].item()
-    y2 = andro_oos.filter((pl.col('year_filled') == (pl.col('year_filled').max() - 1)) & pl.col('presc_az'))['rx_count'].item()
-    y3 = andro_oos.filter((pl.col('year_filled') == pl.col('year_filled').max()) & pl.col('presc_az'))['rx_count'].item()
-
-    delta = human_format(y1 - y0)
-    delta2 = human_format(y3 - y2)
-
-    andro_oos_fig.add_vrect(x0=x0, x1=x1, fillcolor='orange', opacity=0.25, line_width=0, annotation_text=f'out of state increase: {delta}', annotation_position='bottom right', annotation_font_color='red', annotation_font_size=10)
-    andro_oos_fig.add_vrect(x0=x0, x1=x1, fillcolor='orange', opacity=0, line_width=0, annotation_text=f'in state state increase: {delta2}', annotation_position='top left', annotation_font_color='green', annotation_font_size=10)
-    andro_oos_fig.write_html('charts/2024/andro_oos.html', include_plotlyjs='cdn')
-
-    print('andro oos complete')
-
-    print('oos complete')
-
-def bup():
-    # ---
-    # bup
-    # ---
-    print('generating bup...')
-
-    bup_luid = tableau.find_view_luid('Bup Dispensed', workbook_name=WORKBOOK)
-    bup_rx = (
-        tableau.lazyframe_from_view_id(bup_luid, filters=filters, infer_schema_length=100)
-        .select(
-            pl.col('Year of Filled At').alias('year_filled'),
-            pl.col('Prescription Count').str.replace_all(',','').cast(pl.Int32).alias('rx_count'),
-        )
-        .sort('year_filled')
-        .collect()
-    )
-
-    bup_fig = px.line(bup_rx, x='year_filled', y='rx_count', title='buprenorphine dispensations by year', hover_data={'year_filled':True, 'rx_count':':.3s'})
-    bup_fig.write_html('charts/2024/bup.html', include_plotlyjs='cdn')
-
-    print('buprenorphine complete')
-
-def opi_pills():
-    print('generating opi_pills...')
-    opi_pills = tableau.find_view_luid(view_name='Opi Pills Dispensed', workbook_name=WORKBOOK)
-
-    pills = (
-        tableau.lazyframe_from_view_id(opi_pills, filters=filters, infer_schema_length=100)
-        .select(
-            pl.col('Year of Filled At').alias('year_filled'),
-            pl.col('Prescription Count').str.replace_all(',','').cast(pl.Int32).alias('rx_count'),
-            pl.col('Quantity').str.replace_all(',','').cast(pl.Float32).round(0).alias('pills_count'),
-        )
-        .with_columns(
-            (pl.col('pills_count') / pl.col('rx_count')).alias('pills_per_rx')
+            .sort('year_filled', 'patient_county')
         )
-        .sort('year_filled')
-        .collect()
-    )
-
-    opi_pp = px.line(pills, x='year_filled', y='pills_per_rx', title='opioid pills per dispensation', hover_data={'year_filled':True, 'pills_per_rx':':.3s'})
-    opi_pp.write_html('charts/2024/opi_pp.html', include_plotlyjs='cdn')
-
-    layout = dict(
-        hoversubplots='axis',
-        title=dict(text='opioid pills and dispensations'),
-        hovermode='x',
-        grid=dict(rows=3, columns=1)
-    )
-
-    data = [
-        go.Scatter(x=pills['year_filled'], y = pills['rx_count'], xaxis='x', yaxis='y', name='dispensations', hovertemplate='%{y:.3s}'),
-        go.Scatter(x=pills['year_filled'], y = pills['pills_count'], xaxis='x', yaxis='y2', name='pills', hovertemplate='%{y:.3s}'),
-        go.Scatter(x=pills['year_filled'], y = pills['pills_per_rx'], xaxis='x', yaxis='y3', name='pills per dispensation', hovertemplate='%{y:.3s}'),
-    ]
-
-    opi_pills_per = go.Figure(data=data, layout=layout)
-    opi_pills_per.write_html('charts/2024/opi_pp_stacked.html', include_plotlyjs='cdn')
-    print('opi_pills complete')
-
 
+    def obs_drug(drug:str) -> pl.LazyFrame:
+        return data['obs'].filter(pl.col('drug') == drug).sort('year_filled')
+
+    def oos_drug(drug:str) -> pl.LazyFrame:
+        return data['oos'].filter(pl.col('drug type') == drug).sort('year_filled')
+
+    drugs = {**FRAME_DRUGS, **(drugs or {})}
+    builders:dict[str, Callable[[], pl.LazyFrame]] = {
+        'pat_county_rates':pat_county_rates,
+        'cs_disp':lambda: data['cs_disp'].sort('year_filled'),
+        # 'cs_disp_sched':lambda: data['cs_disp_sched'].sort('year_filled'), # not interesting this year
+        'opi':lambda: obs_drug(drugs['opi']),
+        'benzo':lambda: obs_drug(drugs['benzo']),
+        'stims':lambda: obs_drug(drugs['stims']),
+        'benzo_oos':lambda: oos_drug(drugs['benzo_oos']),
+        'andro_oos':lambda: oos_drug(drugs['andro_oos']),
+        'bup_rx':lambda: data['bup_rx'].sort('year_filled'),
+        'pills':lambda: data['pills'].with_columns((pl.col('pills_count') / pl.col('rx_count')).alias('pills_per_rx')).sort('year_filled'),
+        'obs_yoy':lambda: deltas.summary({'obs':data['obs']}),
+        'oos_yoy':lambda: deltas.summary({'oos':data['oos']}),
+        'yoy':lambda: deltas.summary(data),
+        'movers':lambda: deltas.largest_movers(deltas.summary(data)),
+    }
+    return {name:build() for name, build in builders.items() if frames is None or name in frames}
+
+def plan(names:list[str]) -> tuple[set[str], set[str]]:
+    """
+    walks the dependencies from sections to the frames they take to the data those
+    frames are derived from
+
+    args:
+        names: `sections.SECTIONS` keys to render
+
+    returns:
+        a tuple of (frames to derive, data to fetch), data being `DATASETS` keys,
+        `pop` and `counties`
+    """
+    inputs = {key for name in names for key in sections.SECTIONS[name].inputs}
+    frames = inputs & FRAME_SOURCES.keys()
+    sources = {source for frame in frames for source in FRAME_SOURCES[frame]} | (inputs - frames)
+    return frames | {frame for frame in REPORT_FRAMES if set(FRAME_SOURCES[frame]) <= sources}, sources
+
+def list_sections() -> None:
+    for name, section in sections.SECTIONS.items():
+        frames, sources = plan([name])
+        print(f'{name}: {", ".join(section.outputs)}')
+        print(f'    frames: {", ".join(sorted(frames))}')
+        print(f'    data: {", ".join(sorted(sources))}')
+
+def collect_frames(queries:dict[Any, pl.LazyFrame]) -> dict[Any, pl.DataFrame]:
+    """
+    materializes all the derived queries in one `pl.collect_all()` call so polars can
+    share scans and common subplans between them
+
+    args:
+        queries: the output of `derive()`, or several of them under other keys
+
+    returns:
+        a dict of the same names to DataFrames
+    """
+    with span('collect', frames=len(queries)) as collect:
+        frames = dict(zip(queries, pl.collect_all(list(queries.values()))))
+        collect.rows = sum(frame.height for frame in frames.values())
+    return frames
 
 def main():
-    os.makedirs(os.path.dirname(f'charts/{YEAR}/'), exist_ok=True)
-    county_data()
-    cs_dispensed()
-    # cs_by_sched() # not interesting this year
-    obs()
-    oos_rx()
-    bup()
-    opi_pills()
+    parser = argparse.ArgumentParser(description='generate figures for the az pmp yearly report')
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument('--only', nargs='+', choices=list(sections.SECTIONS), metavar='SECTION', help='render only these sections, fetching only the data they need')
+    selection.add_argument('--skip', nargs='+', choices=list(sections.SECTIONS), metavar='SECTION', help='render every section but these')
+    selection.add_argument('--list', action='store_true', help='list the sections with their charts and the data they need, then exit')
+    parser.add_argument('--years', type=parse_years, default=[YEAR], help=f'report years to generate, eg 2024 or 2019-2025, defaults to {YEAR}')
+    cache_mode = parser.add_mutually_exclusive_group()
+    cache_mode.add_argument('--refresh', action='store_true', help='pull every view from tableau again and revalidate reference data')
+    cache_mode.add_argument('--offline', action='store_true', help='only use cached extracts and reference data, make no requests')
+    parser.add_argument('--workers', type=int, default=8, help='most tableau exports to run at once across every view and year, and most datasets fetched at once')
+    parser.add_argument('--acs-vintage', type=int, default=LATEST_ACS5, help=f'newest acs 5 year release county populations are taken from, each year uses its own release up to this one, defaults to {LATEST_ACS5}')
+    parser.add_argument('--mutable-years', type=int, nargs='*', default=None, help='years pulled from tableau every run, other years are pulled once and kept, defaults to the last report year, given with no years nothing is pulled again')
+    parser.add_argument('--rebuild', action='store_true', help='render every chart even if its data and code are unchanged')
+    parser.add_argument('--images', nargs='+', metavar='FORMAT', choices=['png', 'jpeg', 'webp', 'svg', 'pdf', 'eps'], help='also export every chart as static images, eg --images png pdf')
+    parser.add_argument('--image-size', type=int, nargs=2, default=(1200, 800), metavar=('WIDTH', 'HEIGHT'), help='static image size in layout pixels')
+    parser.add_argument('--image-scale', type=float, default=2.0, help='static image pixels per layout pixel')
+    parser.add_argument('--render-workers', type=int, default=None, help='most chart sections to render at once, defaults to the cpu count, 1 renders serially')
+    parser.add_argument('--snapshots', default=snapshots.ROOT, help=f'directory the derived datasets are published to as arrow ipc for other consumers, defaults to {snapshots.ROOT}/')
+    parser.add_argument('--no-snapshots', action='store_true', help='don\'t publish the derived datasets')
+    parser.add_argument('--trace', default=os.path.join('.cache', 'traces', f'{time.strftime("%Y%m%d-%H%M%S")}.json'), help='chrome trace of the run\'s stages, defaults to a new file in .cache/traces/')
+    args = parser.parse_args()
+
+    if args.list:
+        list_sections()
+        return
+    names = args.only or [name for name in sections.SECTIONS if name not in (args.skip or [])]
+    frame_names, sources = plan(names)
+
+    years = args.years
+    for year in years:
+        os.makedirs(f'charts/{year}', exist_ok=True)
+    reference = ReferenceData(refresh=args.refresh, offline=args.offline)
+    with tableau.TableauClient(extract_cache=ExtractCache(), refresh=args.refresh, offline=args.offline, max_downloads=args.workers) as client, span('fetch'):
+        mutable_years = set(args.mutable_years) if args.mutable_years is not None else None
+        data = fetch_all(client, reference, range(report_window(years[0])[0], years[-1] + 1), sources, max_workers=args.workers, mutable_years=mutable_years, acs_vintage=args.acs_vintage)
+    # every report year is sliced from the same extracts and collected together
+    queries = {(year, name):query for year in years for name, query in derive(window(data, report_window(year)), frame_names).items()}
+    frames = collect_frames(queries)
+    for year in years:
+        if (year, 'movers') in frames:
+            print(f'largest year over year changes into {year}:')
+            print(frames[year, 'movers'].select('dataset', 'county', 'drug', 'presc_az', 'prev', 'rx_count', 'delta_label', 'pct_label'))
+    if not args.no_snapshots:
+        for year in years:
+            snapshots.publish({name:frame for (frame_year, name), frame in frames.items() if frame_year == year}, year, args.snapshots)
+    reports = {
+        f'charts/{year}':{
+            **{name:frame for (frame_year, name), frame in frames.items() if frame_year == year},
+            **({'counties':data['counties']} if 'counties' in data else {}),
+        }
+        for year in years
+    }
+    images = ImageOptions(formats=tuple(args.images), width=args.image_size[0], height=args.image_size[1], scale=args.image_scale) if args.images else None
+    with span('render'):
+        sections.render_all(reports, names, max_workers=args.render_workers, force=args.rebuild, images=images)
+
+    tracer.write_chrome_trace(args.trace)
+    print(tracer.summary())
+    print(f'trace written to {args.trace}')
 
 if __name__  == '__main__':
     main()